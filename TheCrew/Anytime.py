@@ -0,0 +1,49 @@
+import time
+
+"""
+ABOUT:
+Support for computations that have to finish before a deadline.
+Such a computation is written as a generator that yields an AnytimeResult after every step, the last one marked complete.
+When the deadline passes the best result so far is returned, and the next call for the same kripke model continues where it stopped.
+"""
+
+
+class AnytimeResult:
+	"""
+	The value of a computation so far and whether it is final
+	Estimated values carry an error_bound: the largest share of possible worlds, at the estimator's confidence, that may contradict them
+	"""
+
+	def __init__(self, value, complete, error_bound=0.0):
+		self.value = value
+		self.complete = complete
+		self.error_bound = error_bound
+
+
+class AnytimeCache:
+	"""
+	Keeps the computations that were cut off by their deadline, per kripke model
+	A model that changes gets a new version, so computations for an old model or version are dropped
+	"""
+
+	def __init__(self):
+		self.computations = {}
+
+	def run(self, model, key, start, deadline=None, default=None):
+		"""
+		Runs the computation named key for model until it is complete or the deadline passes, and returns its latest result
+		start is called without arguments to create the generator of the computation the first time
+		No step is taken once the deadline has passed, and default is returned if the computation has no result yet
+		"""
+		model_key = (id(model), model.version)
+		if (model_key, key) not in self.computations:
+			self.computations = {cached: value for cached, value in self.computations.items() if cached[0] == model_key}
+			# The model is kept with the computation, so its id can not be reused while the computation is cached
+			self.computations[(model_key, key)] = [start(), None, model]
+
+		computation = self.computations[(model_key, key)]
+		while computation[1] is None or not computation[1].complete:
+			if deadline is not None and time.monotonic() >= deadline:
+				break
+			computation[1] = next(computation[0])
+		return computation[1] if computation[1] is not None else default
@@ -0,0 +1,227 @@
+import argparse
+import random
+
+from GameConfig import GameConfig
+from TheCrew import create_game, deal_cards, generate_mission
+
+"""
+ABOUT:
+An exact knowledge engine that answers common knowledge questions without building the kripke model.
+Every card is a variable whose domain holds the agents that may own it, every agent has to receive exactly as many cards
+as their hand size, and every announcement fixes the owner of a card.
+A fact is common knowledge when it holds in every deal in which at least one agent holds their real hand,
+so "agent X holds card Y" is common knowledge when, for every agent with their real hand fixed, the constraints
+together with "X does not hold Y" can not be satisfied. Satisfiability is decided by propagation and a small DPLL-style search.
+"""
+
+
+class CardConstraints:
+	"""
+	The owners a card may still have, and how many cards each agent still has to receive
+	"""
+
+	def __init__(self, domains, capacities):
+		self.domains = domains
+		self.capacities = capacities
+
+	@classmethod
+	def for_game(cls, game, anchor):
+		"""
+		Returns the constraints of the deals in which the anchor holds their real hand and all announcements hold
+		"""
+		anchor_hand = game.dealt_hands[game.agents.index(anchor)]
+		constraints = cls({card: set(game.agents) for card in game.deck}, {agent: game.config.hand_size for agent in game.agents})
+
+		for card in game.deck:
+			if card in anchor_hand:
+				constraints.domains[card] = {anchor}
+			else:
+				constraints.domains[card].discard(anchor)
+		for agent, card in game.announcements:
+			constraints.domains[card] &= {agent}
+		return constraints
+
+	def copy(self):
+		return CardConstraints({card: owners.copy() for card, owners in self.domains.items()}, self.capacities.copy())
+
+	def propagate(self):
+		"""
+		Narrows the domains until nothing changes
+		An agent who already owns as many cards as they have to receive can own no other card,
+		and an agent who can own only as many cards as they have to receive owns all of them.
+		Returns False when the constraints can not be satisfied
+		"""
+		changed = True
+		while changed:
+			changed = False
+			for agent, capacity in self.capacities.items():
+				owned = [card for card, owners in self.domains.items() if owners == {agent}]
+				possible = [card for card, owners in self.domains.items() if agent in owners and len(owners) > 1]
+
+				if len(owned) > capacity or len(owned) + len(possible) < capacity:
+					return False
+				if possible and len(owned) == capacity:
+					for card in possible:
+						self.domains[card].discard(agent)
+					changed = True
+				elif possible and len(owned) + len(possible) == capacity:
+					for card in possible:
+						self.domains[card] = {agent}
+					changed = True
+
+			if any(not owners for owners in self.domains.values()):
+				return False
+		return True
+
+	def solve(self):
+		"""
+		Returns a deal, as a dict from card to agent, that satisfies the constraints, or None if there is none
+		"""
+		if not self.propagate():
+			return None
+
+		open_cards = [card for card, owners in self.domains.items() if len(owners) > 1]
+		if not open_cards:
+			return {card: next(iter(owners)) for card, owners in self.domains.items()}
+
+		# Branch on the card with the fewest possible owners
+		card = min(open_cards, key=lambda open_card: len(self.domains[open_card]))
+		for agent in sorted(self.domains[card]):
+			branch = self.copy()
+			branch.domains[card] = {agent}
+			deal = branch.solve()
+			if deal is not None:
+				return deal
+		return None
+
+
+class ConstraintEngine:
+	"""
+	Answers the common knowledge of a GameManager from the constraints of the game
+	Deals found while searching are remembered, so most facts are settled without a search of their own
+	"""
+
+	def __init__(self):
+		self.cache = {}
+
+	def get_supported_facts(self, game, anchor):
+		"""
+		Returns the constraints for the anchor and the set of (card, agent) pairs known to occur in one of their deals
+		"""
+		key = (len(game.announcements), anchor)
+		if key not in self.cache:
+			self.cache = {cached: value for cached, value in self.cache.items() if cached[0] == len(game.announcements)}
+
+			constraints = CardConstraints.for_game(game, anchor)
+			deal = constraints.copy().solve()
+			supported = set(deal.items()) if deal is not None else set()
+			if deal is not None:
+				constraints.propagate()
+			self.cache[key] = (constraints, supported)
+		return self.cache[key]
+
+	def is_possible(self, game, anchor, card, agent, owned):
+		"""
+		Returns if there is a deal for the anchor in which agent owns card (or does not own it if owned is False)
+		"""
+		constraints, supported = self.get_supported_facts(game, anchor)
+		if owned and (card, agent) in supported:
+			return True
+		if not owned and any(pair[0] == card and pair[1] != agent for pair in supported):
+			return True
+		if owned and agent not in constraints.domains[card]:
+			return False
+		if not owned and constraints.domains[card] == {agent}:
+			return False
+
+		branch = constraints.copy()
+		if owned:
+			branch.domains[card] = {agent}
+		else:
+			branch.domains[card].discard(agent)
+		deal = branch.solve()
+		if deal is None:
+			return False
+		supported.update(deal.items())
+		return True
+
+	def get_facts(self, game, anchors):
+		"""
+		Returns the facts that hold and the facts that do not hold in every deal in which one of the anchors holds their real hand
+		"""
+		anchors = [anchor for anchor in anchors if self.get_supported_facts(game, anchor)[1]]
+
+		true_facts = []
+		false_facts = []
+		for agent in game.agents:
+			for card in game.get_live_cards():
+				if not any(self.is_possible(game, anchor, card, agent, False) for anchor in anchors):
+					true_facts.append(agent + ":" + str(card))
+				elif not any(self.is_possible(game, anchor, card, agent, True) for anchor in anchors):
+					false_facts.append(agent + ":" + str(card))
+		return true_facts, false_facts
+
+	def get_positive_common_knowledge(self, game, anchors=None):
+		if not anchors:
+			anchors = game.agents
+		return self.get_facts(game, anchors)[0]
+
+	def get_common_knowledge(self, game):
+		true_facts, false_facts = self.get_facts(game, game.agents)
+		return true_facts + ["~" + fact for fact in false_facts]
+
+
+def cross_check(config=None, games=10, seed=None):
+	"""
+	Plays random games with the explicit kripke model and the constraint engine side by side
+	Returns a list of (game, step, explicit, constraint) for every step at which their common knowledge differs
+	"""
+	if config is None:
+		config = GameConfig()
+	generator = random.Random(seed)
+	differences = []
+
+	for game_number in range(games):
+		random.seed(generator.random())
+		hand_cards = deal_cards(config.deck, len(config.agents))
+		mission = generate_mission(config)
+		explicit = create_game(config, [hand.copy() for hand in hand_cards], mission)
+		constraint = create_game(config, [hand.copy() for hand in hand_cards], mission, knowledge_engine=ConstraintEngine())
+
+		for step in range(len(config.deck)):
+			explicit_facts = sorted(explicit.get_common_knowledge())
+			constraint_facts = sorted(constraint.get_common_knowledge())
+			if explicit_facts != constraint_facts:
+				differences.append((game_number, step, explicit_facts, constraint_facts))
+
+			agent = explicit.get_current_player_name()
+			if explicit.can_communicate(agent) and generator.random() < 0.5:
+				card = generator.choice(explicit.get_agent_hand(agent))
+				explicit.communicate(agent, card)
+				constraint.communicate(agent, card)
+
+			card = generator.choice([card for card in explicit.get_current_player_hand() if explicit.is_valid_play(card)])
+			explicit.play_card(card)
+			constraint.play_card(card)
+			if explicit.current_trick.get_nr_of_cards() == len(config.agents):
+				explicit.collect_trick()
+				constraint.collect_trick()
+
+	return differences
+
+
+##### MAIN #####
+"""
+Cross check the constraint engine against the explicit kripke model
+"""
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Cross check the constraint engine against the explicit kripke model.")
+	parser.add_argument("--games", type=int, default=10)
+	parser.add_argument("--ranks", type=int, default=2, help="ranks per suit of the three suit table")
+	parser.add_argument("--seed", type=int)
+	arguments = parser.parse_args()
+
+	differences = cross_check(GameConfig(ranks_per_suit=arguments.ranks), arguments.games, arguments.seed)
+	for difference in differences:
+		print("Game", difference[0], "step", difference[1], "explicit:", difference[2], "constraint:", difference[3])
+	print(len(differences), "differences in", arguments.games, "games.")
@@ -0,0 +1,95 @@
+"""
+ABOUT:
+The configuration of a table of The Crew: the agents, the suits, the number of ranks per suit and the trump suit.
+Cards are numbered from 1 upwards, suit by suit, so with the suits ["suit 1", "suit 2", "trump"] and 2 ranks per suit
+cards 1 and 2 are of suit 1, cards 3 and 4 of suit 2 and cards 5 and 6 are trump cards.
+The whole deck is dealt, so the number of cards has to be divisible by the number of agents.
+
+PERFORMANCE TARGETS:
+The explicit kripke model holds every deal that at least one agent considers possible in the real deal.
+With n agents holding h cards each, every agent considers ((n-1)h)! / (h!)^(n-1) deals possible.
+
+    agents  cards  worlds        relation pairs  target
+    3       6      16            138             instant
+    3       9      58            1.314           instant
+    3       12     208           15.114          model under a second, announcements under 0.1 second
+    4       8      327           41.388          model under a second, announcements under 0.1 second
+    4       12     6.603         ~11.9 mln.      model within seconds, announcements within a second
+    4       16     ~138.000      ~5 bln.         out of reach of the explicit model
+    5       20     ~315 mln.     -               out of reach of the explicit model
+
+Tables beyond 4 agents and 12 cards are meant for engines that do not enumerate the worlds.
+"""
+
+
+class GameConfig:
+	"""
+	Describes the table a game is played at
+	"""
+
+	def __init__(self, agents=("a", "b", "c"), suits=("suit 1", "suit 2", "trump"), ranks_per_suit=2, trump_suit="trump", communications_per_agent=1):
+		self.agents = list(agents)
+		self.suits = list(suits)
+		self.ranks_per_suit = ranks_per_suit
+		self.trump_suit = trump_suit
+		self.communications_per_agent = communications_per_agent
+
+		if not self.agents or len(set(self.agents)) != len(self.agents):
+			raise ValueError("A table needs at least one agent and every agent needs a different name.")
+		if any(not isinstance(agent, str) or ":" in agent for agent in self.agents):
+			raise ValueError("Agent names have to be strings without \":\", which separates the agent from the card in facts.")
+		if not isinstance(ranks_per_suit, int) or ranks_per_suit < 1:
+			raise ValueError("A suit needs at least one rank.")
+		if trump_suit not in self.suits:
+			raise ValueError("The trump suit " + str(trump_suit) + " is not one of the suits.")
+		if len(self.deck) % len(self.agents) != 0:
+			raise ValueError("A deck of " + str(len(self.deck)) + " cards can not be dealt evenly over " + str(len(self.agents)) + " agents.")
+
+	@property
+	def deck(self):
+		return list(range(1, len(self.suits) * self.ranks_per_suit + 1))
+
+	@property
+	def hand_size(self):
+		return len(self.deck) // len(self.agents)
+
+	def get_card_suit(self, card):
+		"""
+		Returns the suit of a card
+		"""
+		if not 1 <= card <= len(self.suits) * self.ranks_per_suit:
+			raise ValueError("Card " + str(card) + " is not in the deck " + str(self.deck) + ".")
+		return self.suits[(card - 1) // self.ranks_per_suit]
+
+	def get_suit_cards(self, suit):
+		"""
+		Returns the cards of a suit, from low to high
+		"""
+		first_card = self.suits.index(suit) * self.ranks_per_suit + 1
+		return list(range(first_card, first_card + self.ranks_per_suit))
+
+	def get_commander_card(self):
+		"""
+		Returns the highest trump card; the player holding it is the commander
+		"""
+		return self.get_suit_cards(self.trump_suit)[-1]
+
+	def get_player_order(self, starting_agent):
+		"""
+		Returns the agents in playing order, starting with starting_agent
+		"""
+		start = self.agents.index(starting_agent)
+		return self.agents[start:] + self.agents[:start]
+
+	def to_dict(self):
+		return {
+			"agents": self.agents,
+			"suits": self.suits,
+			"ranks_per_suit": self.ranks_per_suit,
+			"trump_suit": self.trump_suit,
+			"communications_per_agent": self.communications_per_agent,
+		}
+
+	@classmethod
+	def from_dict(cls, values):
+		return cls(**values)
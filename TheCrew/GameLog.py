@@ -0,0 +1,179 @@
+import argparse
+import json
+import sys
+from collections import OrderedDict
+
+from GameConfig import GameConfig
+from GameManager import GameManager
+from TheCrew import get_real_world, initialise_kripke_model
+
+"""
+ABOUT:
+Compact event logs of games and a replay engine for them.
+A log is a JSONL file with one event per line. Agents and cards are stored as integers; agents by their index in the agent list.
+
+    {"e": "deal", "config": {"agents": ["a", "b", "c"], ...}, "h": [[1, 2], [3, 4], [5, 6]]}
+    {"e": "mission", "a": 0, "c": 1}                            (one event per mission)
+    {"e": "play", "a": 2, "c": 6}
+    {"e": "communicate", "a": 1, "c": 4}
+    {"e": "trick", "a": 2}
+
+Every deal event starts a new game, so a log file can hold any number of games after each other.
+"""
+
+
+class GameLog:
+    """
+    Appends the events of games to a file
+    """
+
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, event):
+        self.file.write(json.dumps(event, separators=(",", ":")) + "\n")
+        self.file.flush()
+
+    def log_deal(self, config, hand_cards):
+        self.write({"e": "deal", "config": config.to_dict(), "h": [list(hand) for hand in hand_cards]})
+
+    def log_mission(self, agent_index, card):
+        self.write({"e": "mission", "a": agent_index, "c": card})
+
+    def log(self, event, agent_index, card=None):
+        """
+        Logs a play, communicate or trick event
+        """
+        if card is None:
+            self.write({"e": event, "a": agent_index})
+        else:
+            self.write({"e": event, "a": agent_index, "c": card})
+
+
+def read_games(lines):
+    """
+    Streams the games in the lines of a log, one list of events per game
+    """
+    game = []
+    for line in lines:
+        if not line.strip():
+            continue
+        event = json.loads(line)
+        if event["e"] == "deal" and game:
+            yield game
+            game = []
+        game.append(event)
+    if game:
+        yield game
+
+
+class Replayer:
+    """
+    Reconstructs games from their events without asking for any input
+    Initial kripke models are cached per deal, so replaying many games with the same deal builds the model only once
+    """
+
+    def __init__(self, model_cache_size=16):
+        self.model_cache = OrderedDict()
+        self.model_cache_size = model_cache_size
+
+    def get_initial_model(self, config, hand_cards):
+        key = (json.dumps(config.to_dict()), tuple(tuple(sorted(hand)) for hand in hand_cards))
+        if key in self.model_cache:
+            self.model_cache.move_to_end(key)
+        else:
+            self.model_cache[key] = initialise_kripke_model(config, hand_cards)
+            if len(self.model_cache) > self.model_cache_size:
+                self.model_cache.popitem(last=False)
+        return self.model_cache[key]
+
+    def start_game(self, events):
+        """
+        Returns the game set up by the deal and mission events of one game, before any move, together with the events of its moves
+        """
+        deal = events[0]
+        mission_events = []
+        for event in events[1:]:
+            if event["e"] != "mission":
+                break
+            mission_events.append(event)
+        if deal["e"] != "deal" or not mission_events:
+            raise ValueError("A game has to start with a deal and a mission event.")
+
+        config = GameConfig.from_dict(deal["config"])
+        agents = config.agents
+        hand_cards = [list(hand) for hand in deal["h"]]
+        missions = [[agents[mission_event["a"]], mission_event["c"]] for mission_event in mission_events]
+
+        ks = self.get_initial_model(config, hand_cards)
+        game = GameManager(ks, config, [hand.copy() for hand in hand_cards], missions, get_real_world(hand_cards))
+        return game, events[1 + len(mission_events):]
+
+    def replay(self, events, recompute=False):
+        """
+        Replays the events of one game and yields (event, game, hints) after every step
+        When recompute is set, hints holds the common knowledge and the known tricks after that step, otherwise it is None
+        """
+        game, moves = self.start_game(events)
+        agents = game.agents
+
+        for event in moves:
+            if not 0 <= event["a"] < len(agents):
+                raise ValueError("Unknown agent in event " + json.dumps(event) + ".")
+            agent = agents[event["a"]]
+
+            if event["e"] == "play":
+                if agent != game.get_current_player_name() or not game.is_valid_play(event["c"]):
+                    raise ValueError("Invalid play event " + json.dumps(event) + ".")
+                game.play_card(event["c"])
+            elif event["e"] == "communicate":
+                if not game.can_communicate(agent) or event["c"] not in game.get_agent_hand(agent):
+                    raise ValueError("Invalid communicate event " + json.dumps(event) + ".")
+                game.communicate(agent, event["c"])
+            elif event["e"] == "trick":
+                if game.current_trick.get_nr_of_cards() != len(agents):
+                    raise ValueError("Trick event " + json.dumps(event) + " before every player has played.")
+                if game.collect_trick() != agent:
+                    raise ValueError("The logged trick winner does not match the replay.")
+            else:
+                raise ValueError("Unknown event " + json.dumps(event) + ".")
+
+            hints = None
+            if recompute:
+                hints = {
+                    "common_knowledge": sorted(game.get_common_knowledge()),
+                    "tricks": [trick.get_cards() for trick in game.get_known_tricks()],
+                }
+            yield event, game, hints
+
+
+def replay_logs(paths, recompute=False, output=sys.stdout):
+    """
+    Replays every game in the log files and writes one JSON line per game, and per step when recompute is set
+    """
+    replayer = Replayer()
+    game_number = 0
+
+    for path in paths:
+        with open(path) as file:
+            for events in read_games(file):
+                game_number += 1
+                game = None
+                for step, (event, game, hints) in enumerate(replayer.replay(events, recompute)):
+                    if hints is not None:
+                        output.write(json.dumps({"game": game_number, "step": step, "event": event, **hints}) + "\n")
+                status = game.get_mission_status() if game is not None else None
+                output.write(json.dumps({"game": game_number, "log": path, "events": len(events), "status": status}) + "\n")
+
+
+##### MAIN #####
+"""
+Replay the given logs
+"""
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay logged games of The Crew.")
+    parser.add_argument("logs", nargs="+")
+    parser.add_argument("--hints", action="store_true", help="recompute the common knowledge and known tricks after every step")
+    arguments = parser.parse_args()
+
+    replay_logs(arguments.logs, arguments.hints)
@@ -1,91 +1,430 @@
-from mlsolver.kripke import World, KripkeStructure
+from mlsolver.kripke import EquivalenceRelation, KripkeStructure, Event, EventModel, product_world_name
 from mlsolver.formula import *
 from Trick import Trick
+from Anytime import AnytimeCache, AnytimeResult
+from collections import Counter, deque
+from itertools import combinations, product
 import time
 
 class GameManager:
-	def __init__(self, kripke_model, agents, deck, hand_cards, mission, communications_per_agent, real_world):
+	def __init__(self, kripke_model, config, hand_cards, mission, real_world, contract_model=False, event_log=None, knowledge_engine=None, time_budget=None, speculator=None):
 
 		self.kripke_model = kripke_model
-		self.agents = agents
-		self.deck = deck
+		self.real_world = real_world
+		self.contract_model = contract_model
+		self.config = config
+		self.agents = config.agents
+		self.deck = config.deck
 		
-		self.mission = mission
+		# A game has one [agent, card] mission, or a list of them that all have to be completed
+		if isinstance(mission[0], (list, tuple)):
+			self.missions = [list(single_mission) for single_mission in mission]
+		else:
+			self.missions = [list(mission)]
+		self.mission = self.missions[0]
 		self.hand_cards = hand_cards
-		self.cards_won = [[] for i in range(3)]
-		self.nr_of_communications = [communications_per_agent for i in range(len(agents))]
+		self.dealt_hands = [hand.copy() for hand in hand_cards]
+		self.cards_won = [[] for i in range(len(self.agents))]
+		self.nr_of_communications = [config.communications_per_agent for i in range(len(self.agents))]
 
 		self.current_trick = Trick()
-		self.player_order = agents
+		self.player_order = self.agents
 		self.current_player = 0
 
-		self.set_player_order(agents[self.get_commander()])
-		self.kripke_model_single_card_update(self.player_order[self.current_player], str(6))
+		# Without a kripke model all knowledge comes from the knowledge engine, see SamplingEngine
+		self.knowledge_engine = knowledge_engine
+		self.announcements = []
 
-		self.real_world = real_world
+		# Cards of finished tricks, whose atoms are projected out of the kripke model
+		self.retired_cards = []
 
-	def world_connected(self, model_worlds, model_relations, test_world):
-		"""
-		Checks a worlds against a list of worlds and a list of relations
-		If the worlds is connected to any world in the list of worlds based
-		on the list of relation, return True 
-		"""
-		for agent in model_relations:
-			for relation in model_relations[agent]:
-				for world in model_worlds:
-					if test_world in relation and world.name in relation:
-						return True
-		return False
+		# Per agent the worlds they consider possible and in how many of them each card is held by each agent, see get_card_locations
+		self.card_locations = {}
+
+		# Whether the players yet to play can win the current trick, per combination of their hands
+		self.trick_outcomes = {}
+
+		# With a time budget (in seconds per move) announcements and hints are computed until a deadline, see Anytime.py
+		self.time_budget = time_budget
+		self.pending_updates = []
+		self.anytime = AnytimeCache()
 
+		# A Speculator computes the models after the possible moves while the players decide, see speculate_moves
+		self.speculator = speculator
+
+		self.event_log = event_log
+		if self.event_log is not None:
+			self.event_log.log_deal(config, hand_cards)
+			for single_mission in self.missions:
+				self.event_log.log_mission(self.agents.index(single_mission[0]), single_mission[1])
+
+		self.set_player_order(self.agents[self.get_commander()])
+		self.kripke_model_single_card_update(self.player_order[self.current_player], str(config.get_commander_card()))
 
 	def generate_two_agent_model(self, kripke_model, agent_1, agent_2, source_world):
 		"""
 		Generates a kripke model that only has the worlds and relations of two of its agents
 		connected to a source world. 
-		This makes sure a connected graph is created and due to the fact that we know each agent
-		considers the real world possible, will make sure that only the knowledge of the third
-		agent is lost, if the real world is used as source world.
 		"""
-		two_agent_model_relations = {
-					agent_1: kripke_model.relations[agent_1].copy(),
-					agent_2: kripke_model.relations[agent_2].copy()
-					}
+		return self.generate_group_model(kripke_model, [agent_1, agent_2], source_world)
 
-		two_agent_model_worlds = []
+	def generate_group_model(self, kripke_model, group, source_world):
+		"""
+		Generates a kripke model that only has the worlds and relations of a group of its agents
+		connected to a source world. 
+		This makes sure a connected graph is created and due to the fact that we know each agent
+		considers the real world possible, will make sure that only the knowledge of the other
+		agents is lost, if the real world is used as source world.
+		"""
+		for result in self.group_worlds_steps(kripke_model, group, source_world):
+			pass
 
-		for i in range(len(kripke_model.worlds)):
-			for world in kripke_model.worlds.copy():
-				if not world in two_agent_model_worlds:
-					if world.name == source_world:
-						two_agent_model_worlds.append(World(world.name, world.assignment))
-					elif self.world_connected(two_agent_model_worlds, two_agent_model_relations, world.name):
-						two_agent_model_worlds.append(World(world.name, world.assignment))
+		group_model = KripkeStructure(kripke_model.worlds, {agent: kripke_model.relations[agent] for agent in group})
 
-		two_agent_model = KripkeStructure(kripke_model.worlds.copy(),two_agent_model_relations)
+		return group_model.restrict_to(result.value)
 
-		return(KripkeStructure(two_agent_model_worlds, two_agent_model_relations))
+	def group_worlds_steps(self, kripke_model, group, source_world, chunk_size=500):
+		"""
+		Collects the worlds of the model of generate_group_model a chunk of relation pairs at a time, yielding an incomplete AnytimeResult after every chunk
+		The last result is complete and holds the names of the worlds
+		"""
+		successors = {agent: {} for agent in group}
+		for agent in group:
+			if isinstance(kripke_model.relations[agent], EquivalenceRelation):
+				# The successor lists of an equivalence relation take one pass over the worlds
+				successors[agent] = kripke_model.successors(agent)
+				continue
+			for count, (start, end) in enumerate(kripke_model.relations[agent], 1):
+				successors[agent].setdefault(start, []).append(end)
+				if count % chunk_size == 0:
+					yield AnytimeResult(None, False)
+
+		# Collect the worlds reachable from the source world with a breadth first search
+		# Worlds that share a list of successors, like the worlds of one class of an equivalence relation, only expand it once
+		connected_worlds = {source_world}
+		expanded = set()
+		queue = deque([source_world])
+		pairs = 0
+		while queue:
+			world = queue.popleft()
+			for agent in group:
+				ends = successors[agent].get(world, ())
+				if id(ends) in expanded:
+					continue
+				expanded.add(id(ends))
+				for end in ends:
+					if end not in connected_worlds:
+						connected_worlds.add(end)
+						queue.append(end)
+				pairs += len(ends)
+			if pairs >= chunk_size:
+				pairs = 0
+				yield AnytimeResult(None, False)
+
+		yield AnytimeResult(connected_worlds, True)
 
 	def check_if_trick_valid(self, trick):
 		cards = trick.get_cards();
 		suit = trick.get_suit();
 
-		if self.get_card_suit(cards[1]) != suit:
-			for card in self.get_agent_hand(self.player_order[1]):
-				if self.get_card_suit(card) == suit:
-					return False
-
-		if self.get_card_suit(cards[2]) != suit:
-			for card in self.get_agent_hand(self.player_order[2]):
-				if self.get_card_suit(card) == suit:
-					return False
+		for index in range(1, len(cards)):
+			if self.get_card_suit(cards[index]) != suit:
+				for card in self.get_agent_hand(self.player_order[index]):
+					if self.get_card_suit(card) == suit:
+						return False
 
 		return True
 
 
-	def is_game_winnable(self):
+	def is_game_winnable(self, deadline=None):
+		"""
+		Prints the possible tricks in the current scenario and which of them win the mission.
+		Every check runs until the deadline and continues where it stopped at the next call, see Anytime.py
+		Returns an AnytimeResult of whether a winning trick is known, which is incomplete if a check ran out of time
+		"""
+		tricks = self.get_known_tricks_until(deadline)
+
+		if not tricks.complete:
+			print("There was no time left to find the tricks all players yet to play know can be played.")
+		elif len(tricks.value) > 0:
+			print("Valid tricks that all players yet to play know can be played now:")
+			for trick in tricks.value:
+				print("    " + str(trick.get_cards()))
+
+		# If a trick is winning, print it
+		winning_trick_known = False
+		trick_missions = self.get_known_trick_missions(tricks.value)
+		for trick in tricks.value:
+			if any(trick in trick_missions.get((mission[0], mission[1]), []) for mission in self.get_open_missions()):
+				print("Of these, a winning trick is:", trick.get_cards())
+				winning_trick_known = True
+
+		jointly_winnable = self.players_jointly_know_winnable_until(deadline)
+		if not jointly_winnable.complete:
+			print("There was no time left to check what the players yet to play know together.")
+		elif jointly_winnable.value:
+			print("Together, the players yet to play know that a winning trick can be played.")
+
+		if self.knowledge_engine is not None and hasattr(self.knowledge_engine, "estimate_winnability"):
+			share, lower, upper = self.knowledge_engine.estimate_winnability(self)
+			print("In about " + str(round(100 * share)) + "% (" + str(round(100 * lower)) + "-" + str(round(100 * upper)) + "%) of the possible deals a winning trick can still be played.")
+
+		if len(tricks.value) > 0: print("")
+
+		winnable = winning_trick_known or (jointly_winnable.value and jointly_winnable.complete)
+		return AnytimeResult(winnable, tricks.complete and jointly_winnable.complete)
+
+	def players_jointly_know_winnable(self):
+		"""
+		Returns if the players yet to play this trick have distributed knowledge that a winning trick can still be played
+		That is the case if they can in every world the real world reaches through the intersection of their relations (Box_D)
+		"""
+		return self.players_jointly_know_winnable_until().value
+
+	def players_jointly_know_winnable_until(self, deadline=None):
+		"""
+		Returns an AnytimeResult of players_jointly_know_winnable that is computed until the deadline
+		"""
+		if self.kripke_model is None:
+			return AnytimeResult(False, True)
+
+		key = ("jointly winnable", len(self.retired_cards), tuple(self.current_trick.get_cards()))
+		return self.anytime.run(self.kripke_model, key, self.players_jointly_know_winnable_steps, deadline, AnytimeResult(True, False))
+
+	def players_jointly_know_winnable_steps(self, chunk_size=500):
+		"""
+		Checks the worlds the players yet to play jointly consider possible a chunk at a time, yielding an AnytimeResult after every chunk
+		"""
+		not_played_yet = self.player_order[self.current_trick.get_nr_of_cards():]
+		for result in self.accessible_worlds_steps(not_played_yet, chunk_size):
+			if not result.complete:
+				yield AnytimeResult(True, False)
+
+		worlds = [world for world in self.kripke_model.worlds if world.name in result.value]
+		yield from self.trick_winnable_steps(worlds, chunk_size)
+
+	def accessible_worlds_steps(self, agents, chunk_size=500):
+		"""
+		Collects the worlds the real world reaches through the intersection of the relations of agents, a chunk of relation pairs at a time,
+		yielding an incomplete AnytimeResult after every chunk
+		The last result is complete and holds the names of the worlds
+		"""
+		accessible_worlds = None
+		for agent in agents:
+			if isinstance(self.kripke_model.relations[agent], EquivalenceRelation):
+				ends = set(self.kripke_model.successors(agent).get(self.real_world, ()))
+				accessible_worlds = ends if accessible_worlds is None else accessible_worlds & ends
+				continue
+			ends = set()
+			for count, (start, end) in enumerate(self.kripke_model.relations[agent], 1):
+				if start == self.real_world:
+					ends.add(end)
+				if count % chunk_size == 0:
+					yield AnytimeResult(None, False)
+			accessible_worlds = ends if accessible_worlds is None else accessible_worlds & ends
+		yield AnytimeResult(accessible_worlds, True)
+
+	def can_win_trick(self, hands):
+		"""
+		Returns if the players yet to play, holding hands, can complete the current trick so that it wins the mission
+		"""
+		open_missions = self.get_open_missions()
+
+		for trick in self.get_possible_tricks(hands):
+			if any(mission[1] in trick.get_cards() for mission in open_missions) and self.is_winning_trick(trick):
+				return True
+		return False
+
+	def get_possible_tricks(self, hands):
+		"""
+		Generates every trick the players yet to play can complete when they hold hands
+		"""
+		cards_played_this_trick = self.current_trick.get_cards()
+
+		if cards_played_this_trick:
+			leads = [[]]
+		else:
+			# The first player may lead any card, after which the others have to follow its suit
+			leads = [[card] for card in hands[0]]
+			hands = hands[1:]
+
+		for lead in leads:
+			trick_start = cards_played_this_trick + lead
+			suit = self.get_card_suit(trick_start[0])
+
+			allowed_cards = []
+			for hand in hands:
+				suit_cards = [card for card in hand if self.get_card_suit(card) == suit]
+				allowed_cards.append(suit_cards if suit_cards else hand)
+
+			for cards in product(*allowed_cards):
+				yield Trick(suit, trick_start + list(cards))
+
+	def get_completed_missions(self, trick):
+		"""
+		Returns every (agent, card) mission the trick completes: the winner of the trick with each of its cards
+		The winner is determined once for all missions
+		"""
+		winning_agent = self.determine_winner(trick)
+		return {(winning_agent, card) for card in trick.get_cards()}
+
+	def get_possible_missions(self, hands):
+		"""
+		Returns every (agent, card) mission that the players yet to play can complete in this trick when they hold hands
+		"""
+		missions = set()
+		for trick in self.get_possible_tricks(hands):
+			missions |= self.get_completed_missions(trick)
+		return missions
+
+	def get_known_trick_missions(self, tricks=None):
+		"""
+		Returns for every (agent, card) mission the known tricks that complete it, see get_known_tricks
+		The tricks are enumerated and their winners determined once for all missions
+		"""
+		if tricks is None:
+			tricks = self.get_known_tricks()
+
+		trick_missions = {}
+		for trick in tricks:
+			for mission in self.get_completed_missions(trick):
+				trick_missions.setdefault(mission, []).append(trick)
+		return trick_missions
+
+	def get_missions_agent_knows_winnable(self, agent):
+		"""
+		Returns every (agent, card) mission that agent knows can be completed in this trick, in one pass over the worlds agent considers possible
+		Worlds in which the players yet to play hold the same hands share one set of possible missions
+		"""
+		if self.kripke_model is None:
+			return set()
+
+		not_played_yet = self.player_order[self.current_trick.get_nr_of_cards():]
+		cards_played_this_trick = self.current_trick.get_cards()
+		accessible_worlds = self.get_accessible_worlds(agent)
+
+		known_missions = None
+		possible_missions = {}
+		for world in self.kripke_model.worlds:
+			if world.name not in accessible_worlds:
+				continue
+
+			hands = self.get_hands_in_world(world, not_played_yet, cards_played_this_trick + self.retired_cards)
+			if hands not in possible_missions:
+				possible_missions[hands] = self.get_possible_missions([list(hand) for hand in hands])
+			if known_missions is None:
+				known_missions = set(possible_missions[hands])
+			else:
+				known_missions &= possible_missions[hands]
+			if not known_missions:
+				break
+
+		return known_missions or set()
+
+	def get_hands_in_world(self, world, players, excluded_cards):
+		"""
+		Returns the sorted hands of the players in a world, leaving out the excluded cards
+		"""
+		hands = {player: [] for player in players}
+		for fact, value in world.assignment.items():
+			player, card = fact.split(":")
+			if value and player in hands and int(card) not in excluded_cards:
+				hands[player].append(int(card))
+		return tuple(tuple(sorted(hands[player])) for player in players)
+
+	def agent_knows_winnable(self, agent):
+		"""
+		Returns if agent knows that the players yet to play can still win the current trick
+		That is the case if they can in every world agent considers possible.
+		Worlds in which the players yet to play hold the same hands share one trick outcome
+		"""
+		return self.agent_knows_winnable_until(agent).value
+
+	def agent_knows_winnable_until(self, agent, deadline=None):
+		"""
+		Returns an AnytimeResult of agent_knows_winnable that is computed until the deadline
+		An incomplete result of True means no world agent considers possible has prevented the win so far
+		"""
+		if self.kripke_model is None:
+			return AnytimeResult(False, True)
+
+		key = ("winnable", agent, len(self.retired_cards), tuple(self.current_trick.get_cards()))
+		return self.anytime.run(self.kripke_model, key, lambda: self.agent_knows_winnable_steps(agent), deadline, AnytimeResult(True, False))
+
+	def agent_knows_winnable_steps(self, agent, chunk_size=500):
+		"""
+		Checks the worlds agent considers possible a chunk at a time, yielding an AnytimeResult after every chunk
+		"""
+		if agent in self.card_locations:
+			accessible_worlds = self.get_accessible_worlds(agent)
+		else:
+			for result in self.accessible_worlds_steps([agent], chunk_size):
+				if not result.complete:
+					yield AnytimeResult(True, False)
+			accessible_worlds = result.value
+
+		worlds = [world for world in self.kripke_model.worlds if world.name in accessible_worlds]
+		yield from self.trick_winnable_steps(worlds, chunk_size)
+
+	def trick_winnable_steps(self, worlds, chunk_size):
+		"""
+		Checks if the current trick can be won in all worlds, a chunk at a time, yielding an AnytimeResult after every chunk
+		An incomplete result of True means none of the worlds checked so far has prevented the win
+		"""
+		for start in range(0, len(worlds), chunk_size):
+			for world in worlds[start:start + chunk_size]:
+				if not self.is_trick_winnable_in_world(world):
+					yield AnytimeResult(False, True)
+					return
+
+			yield AnytimeResult(True, start + chunk_size >= len(worlds))
+
+		yield AnytimeResult(True, True)
+
+	def is_trick_winnable_in_world(self, world):
+		"""
+		Returns if the players yet to play can win the current trick with the hands they hold in world
+		Worlds in which they hold the same hands share one trick outcome
+		"""
+		not_played_yet = self.player_order[self.current_trick.get_nr_of_cards():]
+		cards_played_this_trick = self.current_trick.get_cards()
+		hands = self.get_hands_in_world(world, not_played_yet, cards_played_this_trick + self.retired_cards)
+		key = (tuple(cards_played_this_trick), hands)
+
+		if key not in self.trick_outcomes:
+			self.trick_outcomes[key] = self.can_win_trick([list(hand) for hand in hands])
+		return self.trick_outcomes[key]
+
+	def is_winning_trick(self, trick):
+		"""
+		Returns if the trick hands the card of a mission that is not yet completed to its agent
+		"""
+		completed_missions = self.get_completed_missions(trick)
+		return any((mission[0], mission[1]) in completed_missions for mission in self.get_open_missions())
+
+	def get_known_tricks(self):
 		"""
 		Generates possible tricks in the current scenario.
 		"""
+		return self.get_known_tricks_until().value
+
+	def get_known_tricks_until(self, deadline=None):
+		"""
+		Returns an AnytimeResult of get_known_tricks that is computed until the deadline
+		An incomplete result holds no tricks, as the common knowledge of only some worlds could allow tricks that are not known
+		"""
+		if self.kripke_model is None:
+			for result in self.known_tricks_steps():
+				pass
+			return result
+
+		key = ("known tricks", len(self.retired_cards), tuple(self.current_trick.get_cards()))
+		return self.anytime.run(self.kripke_model, key, self.known_tricks_steps, deadline, AnytimeResult([], False))
+
+	def known_tricks_steps(self, chunk_size=500):
+		"""
+		Generates the known tricks, yielding an incomplete AnytimeResult after every chunk of the group model and of common knowledge
+		"""
 		# Determine which players yet to play this trick
 		not_played_yet = self.player_order[self.current_trick.get_nr_of_cards():]
 		cards_played_this_trick = self.current_trick.get_cards()
@@ -97,55 +436,51 @@ class GameManager:
 				played_cards += [card]
 
 		# Determine the cards each player has that are common knowledge
-		playable_cards = {"a" : [], "b" : [], "c" : []}
+		playable_cards = {agent: [] for agent in self.agents}
 		common_knowledge = []
 
-		if len(not_played_yet) == 3:
-			# If no card has been played yet in the current trick we get common knowledge from the complete model
-			common_knowledge = self.get_positive_common_knowledge(self.kripke_model)
-		elif len(not_played_yet) == 2:
-			# If one card has been played, the knowledge of that player no longer matters, hence we use the CK from a two agent model
-			model = self.generate_two_agent_model(self.kripke_model, not_played_yet[0], not_played_yet[1], self.real_world)
-			common_knowledge = self.get_positive_common_knowledge(model)
-			# The first player already played, so their card is already set.
-			playable_cards[self.player_order[0]] = self.current_trick.get_cards()
-		elif len(not_played_yet) == 1:
-			# If two cards have been played no knowledge matters anymore, only all the cards in the hand of the last player do
-			playable_cards[self.player_order[0]] = [self.current_trick.get_cards()[0]]
-			playable_cards[self.player_order[1]] = [self.current_trick.get_cards()[1]]
+		# The players who already played this trick have their card set.
+		for player, card in zip(self.player_order, cards_played_this_trick):
+			playable_cards[player] = [card]
+
+		if len(not_played_yet) == 1:
+			# If only one player is left no knowledge matters anymore, only all the cards in the hand of the last player do
 			playable_cards[not_played_yet[0]] = self.get_agent_hand(not_played_yet[0])
+		elif self.knowledge_engine is not None:
+			# The knowledge engine estimates the common knowledge among those yet to play without the model
+			common_knowledge = self.knowledge_engine.get_positive_common_knowledge(self, not_played_yet)
+		else:
+			if len(not_played_yet) == len(self.agents):
+				# If no card has been played yet in the current trick we get common knowledge from the complete model
+				worlds = self.kripke_model.worlds
+			else:
+				# If some cards have been played, the knowledge of those players no longer matters, hence we use the CK from the worlds of a model of the players yet to play
+				for result in self.group_worlds_steps(self.kripke_model, not_played_yet, self.real_world, chunk_size):
+					if not result.complete:
+						yield AnytimeResult([], False)
+				worlds = [world for world in self.kripke_model.worlds if world.name in result.value]
+
+			for result in self.positive_common_knowledge_steps(worlds, chunk_size):
+				if not result.complete:
+					yield AnytimeResult([], False)
+			common_knowledge = result.value
 
 		# For all players who have not played yet we add the cards that are common knowledge among those yet to play to their playable card list.
 		for fact in common_knowledge:
-			card = int(fact[2:])
-			player = fact[0]
+			player, card = fact.split(":")
+			card = int(card)
 			if not card in played_cards and player in not_played_yet:
 				playable_cards[player] += [card]
 
 		# Put all the pieces together and actually generate the tricks
 		tricks = []
-		for card_1 in playable_cards[self.player_order[0]]:
-			for card_2 in playable_cards[self.player_order[1]]:
-				for card_3 in playable_cards[self.player_order[2]]:
-					cards = [card_1, card_2, card_3]
-					first_player = self.player_order[0]
-					suit = self.get_card_suit(cards[self.player_order.index(first_player)])
-					trick = Trick(suit, cards)
-					if self.check_if_trick_valid(trick):
-						tricks += [trick]
-
-		if len(tricks) > 0:
-			print("Valid tricks that all players yet to play know can be played now:")
-			for trick in tricks:
-				print("    " + str(trick.get_cards()))
+		for cards in product(*(playable_cards[player] for player in self.player_order)):
+			suit = self.get_card_suit(cards[0])
+			trick = Trick(suit, list(cards))
+			if self.check_if_trick_valid(trick):
+				tricks += [trick]
 
-		# If a trick is winning, print it
-		for trick in tricks:
-			winning_agent = self.determine_winner(trick)
-			if self.mission[0] == winning_agent and self.mission[1] in trick.get_cards():
-				print("Of these, a winning trick is:", trick.get_cards())
-
-		if len(tricks) > 0: print("")
+		yield AnytimeResult(tricks, True)
 
 	def get_current_player_name(self):
 		"""
@@ -166,26 +501,188 @@ class GameManager:
 		"""
 		for player in range(len(self.hand_cards)):
 			for card in range(len(self.hand_cards[player])):
-				if self.hand_cards[player][card] == 6:
+				if self.hand_cards[player][card] == self.config.get_commander_card():
 					return player
 
 	def kripke_model_single_card_update(self, agent, card):
 		"""
 		Updates the kripke model based on a specific card becoming common knowledge
 		"""
+		self.announcements.append((agent, int(card)))
+		if self.kripke_model is None:
+			return
+
+		if self.speculator is not None and not self.pending_updates:
+			model = self.speculator.get(self.kripke_model, agent, card, self.time_budget)
+			if model is not None:
+				if self.set_announced_model(model) and self.contract_model:
+					self.contract_kripke_model()
+				return
+
 		agent_card = agent + ":" + card
-		self.kripke_model = self.kripke_model.solve(Atom(agent_card))
+		self.pending_updates.append(self.kripke_model.solve_steps(Atom(agent_card)))
+		self.refine_kripke_model(self.get_deadline())
+
+	def set_announced_model(self, model):
+		"""
+		Replaces the kripke model by the model after an announcement, which holds a subset of its worlds
+		Returns if any world was removed
+		"""
+		remaining_world_names = {world.name for world in model.worlds}
+		removed_worlds = [world for world in self.kripke_model.worlds if world.name not in remaining_world_names]
+		if self.speculator is not None:
+			self.speculator.discard(None, self.kripke_model)
+		self.kripke_model = model
+		self.update_card_locations(removed_worlds)
+
+		return len(removed_worlds) > 0
+
+	def speculate_moves(self):
+		"""
+		Lets the speculator compute the models after the plays of the current player and after every possible communication
+		"""
+		if self.speculator is None or self.kripke_model is None or self.pending_updates:
+			return
+
+		current_player = self.get_current_player_name()
+		moves = [(current_player, card) for card in self.get_current_player_hand() if self.is_valid_play(card)]
+		for agent in self.agents:
+			if self.can_communicate(agent):
+				moves += [(agent, card) for card in self.get_agent_hand(agent)]
+		self.speculator.speculate(self.kripke_model, moves)
+
+	def get_deadline(self):
+		"""
+		Returns the deadline of a move started now, or None without a time budget
+		"""
+		if self.time_budget is None:
+			return None
+		return time.monotonic() + self.time_budget
+
+	def refine_kripke_model(self, deadline=None):
+		"""
+		Continues the announcements that were not done in time, until they are done or the deadline passes
+		Until then the model holds worlds that the announcements remove, so every agent knows at most what they should.
+		Returns if the kripke model is complete
+		"""
+		removed_world_names = set()
+		while self.pending_updates:
+			if deadline is not None and time.monotonic() >= deadline:
+				break
+			try:
+				removed_world_names |= next(self.pending_updates[0])
+			except StopIteration:
+				self.pending_updates.pop(0)
+
+		if removed_world_names:
+			self.set_announced_model(self.kripke_model.restrict_to(world.name for world in self.kripke_model.worlds if world.name not in removed_world_names))
+
+		if not self.pending_updates and removed_world_names and self.contract_model:
+			self.contract_kripke_model()
+
+		return not self.pending_updates
+
+	def kripke_model_private_card_update(self, agent, card, recipient):
+		"""
+		Updates the kripke model based on agent showing a card to recipient only
+		Both of them know which card was shown, the other agents only know that agent showed recipient one of their cards.
+		The real world becomes the world in which the card was shown in the old real world
+		"""
+		if self.kripke_model is None:
+			return
+		self.refine_kripke_model()
+
+		events = [Event(str(shown_card), Atom(agent + ":" + str(shown_card))) for shown_card in self.deck]
+		relations = {}
+		for other in self.agents:
+			if other in (agent, recipient):
+				relations[other] = {(event.name, event.name) for event in events}
+			else:
+				relations[other] = {(event.name, other_event.name) for event in events for other_event in events}
+
+		root = (self.real_world, str(card))
+		self.kripke_model = self.kripke_model.product_update(EventModel(events, relations), root)
+		self.real_world = product_world_name(*root)
+		self.card_locations = {}
+
+		if self.contract_model:
+			self.contract_kripke_model()
+
+	def contract_kripke_model(self):
+		"""
+		Collapses all worlds of the kripke model that no formula can tell apart
+		The distributed knowledge of every group of players yet to play is kept exact, see get_distributed_knowledge_groups
+		The real world is renamed to the world that now represents it
+		"""
+		self.kripke_model, representatives = self.kripke_model.bisimulation_contraction(self.get_distributed_knowledge_groups())
+		self.real_world = representatives.get(self.real_world, self.real_world)
+		self.card_locations = {}
+
+	def get_distributed_knowledge_groups(self):
+		"""
+		Returns the groups of at least two agents whose distributed knowledge may be asked for
+		The players yet to play a trick can be any such group, depending on who leads it
+		"""
+		return [group for size in range(2, len(self.agents) + 1) for group in combinations(self.agents, size)]
+
+	def get_card_locations(self, agent):
+		"""
+		Returns for each card how many of the worlds agent considers possible have it in the hand of each agent,
+		as a dict from card to a Counter of agents
+		The table is computed once and then kept up to date as announcements remove worlds
+		"""
+		if self.kripke_model is None:
+			return None
+
+		return self.get_card_location_table(agent)[1]
+
+	def get_accessible_worlds(self, agent):
+		"""
+		Returns the names of the worlds agent considers possible
+		"""
+		return self.get_card_location_table(agent)[0]
+
+	def get_card_location_table(self, agent):
+		"""
+		Returns the worlds agent considers possible together with their card location table
+		"""
+		if agent not in self.card_locations:
+			for result in self.accessible_worlds_steps([agent]):
+				pass
+			accessible_worlds = result.value
+			locations = {card: Counter() for card in self.get_live_cards()}
+			for world in self.kripke_model.worlds:
+				if world.name in accessible_worlds:
+					self.count_card_locations(locations, world, 1)
+			self.card_locations[agent] = (accessible_worlds, locations)
+
+		return self.card_locations[agent]
+
+	def count_card_locations(self, locations, world, amount):
+		"""
+		Adds amount to the location of every card held in world
+		"""
+		for fact, value in world.assignment.items():
+			if value:
+				holder, card = fact.split(":")
+				if int(card) in locations:
+					locations[int(card)][holder] += amount
+
+	def update_card_locations(self, removed_worlds):
+		"""
+		Subtracts the removed worlds from the card location tables of the agents who considered them possible
+		"""
+		for accessible_worlds, locations in self.card_locations.values():
+			for world in removed_worlds:
+				if world.name in accessible_worlds:
+					accessible_worlds.discard(world.name)
+					self.count_card_locations(locations, world, -1)
 
 	def get_card_suit(self, card):
 		"""
-		Returns which of the three suits the card has
-		It does this by looking if the card is from the first, second or third part of the deck
+		Returns which suit the card has, see GameConfig
 		"""
-		if (card / len(self.deck)) < 0.34:
-			return "suit 1"
-		elif (card / len(self.deck)) < 0.67:
-			return "suit 2"
-		return "trump"
+		return self.config.get_card_suit(card)
 
 	def play_action(self):
 		"""
@@ -196,36 +693,57 @@ class GameManager:
 		Finally we remove the card from the current player's hand and add it to the cards in the current trick.
 		"""
 		player_hand = self.get_current_player_hand()
-		has_trick_suit_card = False
-
-		for card in player_hand:
-			if self.get_card_suit(card) == self.current_trick.get_suit():
-				has_trick_suit_card = True
 
 		print("Player " + self.get_current_player_name() + " has the following cards in their hand:", player_hand)
 		if self.current_trick.get_suit() != None: print("The current trick suit is", self.current_trick.get_suit())
+		self.speculate_moves()
 		move = input("What card is played by player " + self.get_current_player_name() + "?\n")
 
-		while (not move.isnumeric()) or (has_trick_suit_card and self.get_card_suit(int(move)) != self.current_trick.get_suit()) or int(move) not in player_hand:
+		while (not move.isnumeric()) or not self.is_valid_play(int(move)):
 			move = input("Invalid card. If they can, a player must follow suit. Please choose a different card.\n")
 
 		print("Player "+ self.get_current_player_name() + " played card ", move)
 
-		self.kripke_model_single_card_update(self.get_current_player_name(), move)
+		self.play_card(int(move))
+
+	def is_valid_play(self, card):
+		"""
+		Returns if the current player may play the card
+		The card has to be in their hand and, if they can, they have to follow suit
+		"""
+		player_hand = self.get_current_player_hand()
+		if card not in player_hand:
+			return False
+
+		has_trick_suit_card = False
+
+		for hand_card in player_hand:
+			if self.get_card_suit(hand_card) == self.current_trick.get_suit():
+				has_trick_suit_card = True
+
+		return not has_trick_suit_card or self.get_card_suit(card) == self.current_trick.get_suit()
+
+	def play_card(self, card):
+		"""
+		Plays a card of the current player without asking for input
+		The card is assumed to be a valid play, see is_valid_play
+		"""
+		self.log_event("play", self.get_current_player_name(), card)
+		self.kripke_model_single_card_update(self.get_current_player_name(), str(card))
 
 		if self.current_trick.get_nr_of_cards() == 0:
-			self.current_trick.set_suit(self.get_card_suit(int(move)))
+			self.current_trick.set_suit(self.get_card_suit(card))
 
-		self.hand_cards[self.agents.index(self.player_order[self.current_player])].remove(int(move))
-		self.current_trick.add_card(move)
-		self.current_player = (self.current_player + 1) % 3
+		self.hand_cards[self.agents.index(self.player_order[self.current_player])].remove(card)
+		self.current_trick.add_card(card)
+		self.current_player = (self.current_player + 1) % len(self.agents)
 
 	def ask_for_communicating_agent(self):
 		"""
 		This function querries the user to say which agent they want to have communicate one of their cards
 		We check if this input is actually an agent and if this agent can still communicate.
 		"""
-		agent = input("Which player (" + self.agents[0] + " ," + self.agents[1] + " or " + self.agents[2] + ") would like to communicate a card? (type \"cancel\" to cancel)\n")
+		agent = input("Which player (" + " ,".join(self.agents[:-1]) + " or " + self.agents[-1] + ") would like to communicate a card? (type \"cancel\" to cancel)\n")
 		print("")
 
 		if agent == "cancel":
@@ -275,12 +793,35 @@ class GameManager:
 
 		if communicated_card != "cancel":
 			print(communicating_agent + " communicated card " + communicated_card)
+			self.log_event("communicate", communicating_agent, int(communicated_card))
 			self.kripke_model_single_card_update(str(communicating_agent), communicated_card)
 
+	def can_communicate(self, agent):
+		"""
+		Returns if the agent still has a communication left
+		"""
+		return self.nr_of_communications[self.agents.index(agent)] > 0
+
+	def communicate(self, agent, card):
+		"""
+		Communicates a card of an agent without asking for input
+		The agent is assumed to be able to communicate and to hold the card
+		"""
+		self.nr_of_communications[self.agents.index(agent)] -= 1
+		self.log_event("communicate", agent, card)
+		self.kripke_model_single_card_update(agent, str(card))
+
+	def log_event(self, event, agent, card=None):
+		"""
+		Appends an action to the event log, if the game has one
+		"""
+		if self.event_log is not None:
+			self.event_log.log(event, self.agents.index(agent), card)
+
 	def determine_winner(self, trick):
 		"""
 		This function determines the winner of a trick
-		It does this by looping three times (based on number of players)
+		It does this by looping once for every card in the trick (based on number of players)
 		Each loop it looks at one of the players and which card they played this trick
 		Then it selects either the highest card played of the trick suit
 		Or (if trump cards were played) the highest trump card
@@ -289,11 +830,11 @@ class GameManager:
 		winning_player = None
 		cards_in_trick = trick.get_cards()
 
-		for index in range(3):
+		for index in range(len(cards_in_trick)):
 			if winning_card == None:
 				winning_card = cards_in_trick[index]
 				winning_player = self.player_order[index]
-			elif trick.get_suit() != "trump" and self.get_card_suit(cards_in_trick[index]) == "trump":
+			elif trick.get_suit() != self.config.trump_suit and self.get_card_suit(cards_in_trick[index]) == self.config.trump_suit:
 				winning_card = cards_in_trick[index]
 				winning_player = self.player_order[index]
 			elif cards_in_trick[index] > winning_card and trick.get_suit() == self.get_card_suit(cards_in_trick[index]):
@@ -307,12 +848,8 @@ class GameManager:
 		This function returns the new agent order based on which agent should be the starting agent
 		"""
 
-		if starting_agent == "a":
-			self.player_order = ["a", "b", "c"]
-		elif starting_agent == "b":
-			self.player_order = ["b", "c", "a"]
-		elif starting_agent == "c":
-			self.player_order = ["c", "a", "b"]
+		if starting_agent in self.agents:
+			self.player_order = self.config.get_player_order(starting_agent)
 		else:
 			print("------ERROR: COULD NOT SET NEW PLAYER ORDER------")
 
@@ -323,35 +860,96 @@ class GameManager:
 		Then adds the cards of this trick to the winners cards_won pile
 		Then it resets the values of the trick, making the winning agent the first agent to play
 		"""
-		winning_agent = self.determine_winner(self.current_trick)
+		winning_agent = self.collect_trick()
 
 		print("Player", winning_agent, "played the winning card of this trick.")
 
+	def collect_trick(self):
+		"""
+		Ends the current trick without printing and returns the winning agent
+		"""
+		winning_agent = self.determine_winner(self.current_trick)
+
 		winning_agent_index = self.agents.index(winning_agent)
 		self.cards_won[winning_agent_index] += self.current_trick.get_cards()
+		self.retire_cards(self.current_trick.get_cards())
 		self.current_trick.reset()
+		self.trick_outcomes = {}
 		
 		self.set_player_order(winning_agent)
+		self.log_event("trick", winning_agent)
+
+		return winning_agent
+
+	def retire_cards(self, cards):
+		"""
+		Removes the atoms of cards that have been played from the kripke model
+		Worlds that no formula about the remaining cards can tell apart are merged, keeping the distributed knowledge of the groups
+		in get_distributed_knowledge_groups, and the real world is renamed to the world that now represents it.
+		Usually every played card has been announced, no worlds merge and the model is kept as it is
+		"""
+		self.retired_cards += cards
+		if self.kripke_model is None:
+			return
+		self.refine_kripke_model()
+
+		atoms = [agent + ":" + str(card) for agent in self.agents for card in cards]
+		model, representatives = self.kripke_model.project(atoms, self.get_distributed_knowledge_groups())
+		if model is self.kripke_model:
+			for accessible_worlds, locations in self.card_locations.values():
+				for card in cards:
+					locations.pop(card, None)
+			return
+
+		self.kripke_model = model
+		self.real_world = representatives.get(self.real_world, self.real_world)
+		self.card_locations = {}
 
-	def mission_passed(self):
+	def get_live_cards(self):
+		"""
+		Returns the cards of the deck that have not been retired yet
+		"""
+		return [card for card in self.deck if card not in self.retired_cards]
+
+	def mission_passed(self, mission=None):
 		"""
 		This function checks if the mission has been accomplished
 		It does this by seeing if the mission agent has the mission card in their cards_won pile
+		Without a mission given, it checks if all missions have been accomplished
 		"""
-		Mission_agent_index = self.agents.index(self.mission[0])
+		if mission is None:
+			return all(self.mission_passed(single_mission) for single_mission in self.missions)
+
+		Mission_agent_index = self.agents.index(mission[0])
 
 		for card in self.cards_won[Mission_agent_index]:
-			if card == self.mission[1]:
+			if card == mission[1]:
 				return True
 
 		return False
 
+	def get_open_missions(self):
+		"""
+		Returns the missions that have not been accomplished yet
+		"""
+		return [mission for mission in self.missions if not self.mission_passed(mission)]
+
 	def current_player_hand_empty(self):
 		"""
 		Returns if the hand of the current player is empty
 		"""
 		return not self.get_current_player_hand()
 
+	def get_mission_status(self):
+		"""
+		Returns "passed" or "failed" once the game is over and None while it is still going on
+		"""
+		if self.mission_passed():
+			return "passed"
+		elif self.current_player_hand_empty():
+			return "failed"
+		return None
+
 	def check_end_of_trick(self):
 		"""
 		Checks if the trick has ended and if the win or lose condition has been met
@@ -360,11 +958,14 @@ class GameManager:
 			self.end_trick()
 
 
-			if self.mission_passed():
-				print("Player", self.mission[0], "has obtained card", str(self.mission[1]) + "!")
+			mission_status = self.get_mission_status()
+
+			if mission_status == "passed":
+				for mission in self.missions:
+					print("Player", mission[0], "has obtained card", str(mission[1]) + "!")
 				print("Congratulations, you have passed your mission!")
 				return False
-			elif self.current_player_hand_empty():
+			elif mission_status == "failed":
 				print("You have failed your mission, how unfortunate.")
 				return False
 			print("Player", self.player_order[0], "will now start the new trick.")
@@ -377,59 +978,72 @@ class GameManager:
 		"""
 		Generates a complete list of all the common knowlegde present in the model
 		"""
-		# Generate all possible facts
+		for result in self.positive_common_knowledge_steps(ks.worlds):
+			pass
+		return result.value
+
+	def positive_common_knowledge_steps(self, worlds, chunk_size=500):
+		"""
+		Checks the worlds a chunk at a time, yielding an AnytimeResult of the facts that hold in all worlds checked so far
+		"""
+		# Generate all possible facts about the cards still in play
 		fact_list = list()
 		for agent in self.agents:
-			for card in self.deck:
+			for card in self.get_live_cards():
 				fact_list.append(agent + ":" + str(card))
-		true_fact_list = fact_list.copy()
-
-		# Then loop through all worlds
-		for world in ks.worlds:
-			world_facts = list(world.assignment.keys())
-			to_be_removed_true = []
-			# If a fact is not in a world, queue it up fo removal
-			for fact in fact_list:
-				if not fact in world_facts:
-					to_be_removed_true.append(fact)
-			# And then remove all of them from the fact list
-			for fact in to_be_removed_true:
-				if fact in true_fact_list:
-					true_fact_list.remove(fact)
-
-		return true_fact_list
+		true_facts = set(fact_list)
+
+		# Then loop through all worlds, a fact that is not in a world is not common knowledge
+		for start in range(0, len(worlds), chunk_size):
+			for world in worlds[start:start + chunk_size]:
+				true_facts &= world.assignment.keys()
+			yield AnytimeResult([fact for fact in fact_list if fact in true_facts], start + chunk_size >= len(worlds))
+
+		yield AnytimeResult([fact for fact in fact_list if fact in true_facts], True)
 
 	def get_common_knowledge(self):
 		"""
 		Generates a complete list of all the common knowlegde present in the model
 		"""
-		# Generate all possible facts
+		return self.get_common_knowledge_until().value
+
+	def get_common_knowledge_until(self, deadline=None):
+		"""
+		Returns an AnytimeResult of get_common_knowledge that is computed until the deadline
+		An incomplete result only holds for the worlds checked so far, and holds no facts before the first chunk
+		A sampling knowledge engine returns its estimate together with the error bound of the facts, see SamplingEstimate
+		"""
+		if self.knowledge_engine is not None and hasattr(self.knowledge_engine, "estimate_common_knowledge"):
+			estimate = self.knowledge_engine.estimate_common_knowledge(self)
+			facts = estimate.true_facts + ["~" + fact for fact in estimate.false_facts]
+			return AnytimeResult(facts, estimate.complete, estimate.error_bound)
+		if self.knowledge_engine is not None:
+			return AnytimeResult(self.knowledge_engine.get_common_knowledge(self), True)
+
+		return self.anytime.run(self.kripke_model, ("common knowledge", len(self.retired_cards)), self.common_knowledge_steps, deadline, AnytimeResult([], False))
+
+	def common_knowledge_steps(self, chunk_size=500):
+		"""
+		Checks the worlds a chunk at a time, yielding an AnytimeResult of the common knowledge after every chunk
+		"""
+		# Generate all possible facts about the cards still in play
 		fact_list = list()
 		for agent in self.agents:
-			for card in self.deck:
+			for card in self.get_live_cards():
 				fact_list.append(agent + ":" + str(card))
-		true_fact_list = fact_list.copy()
-		false_fact_list = fact_list.copy()
-
-		# Then loop through all worlds
-		for world in self.kripke_model.worlds:
-			world_facts = list(world.assignment.keys())
-			to_be_removed_true = []
-			to_be_removed_false = []
-			# If a fact is not in a world, queue it up fo removal
-			for fact in fact_list:
-				if not fact in world_facts:
-					to_be_removed_true.append(fact)
-				else:
-					to_be_removed_false.append(fact)
-			# And then remove all of them from the fact list
-			for fact in to_be_removed_true:
-				if fact in true_fact_list:
-					true_fact_list.remove(fact)
-			for fact in to_be_removed_false:
-				if fact in false_fact_list:
-					false_fact_list.remove(fact)
-
-		false_fact_list = ["~" + e for e in false_fact_list]
-		return true_fact_list + false_fact_list
-		
\ No newline at end of file
+		true_facts = set(fact_list)
+		false_facts = set(fact_list)
+
+		# Then loop through all worlds, a fact is true in a world if it is in its assignment
+		worlds = self.kripke_model.worlds
+		for start in range(0, len(worlds), chunk_size):
+			for world in worlds[start:start + chunk_size]:
+				world_facts = set(world.assignment.keys())
+				true_facts &= world_facts
+				false_facts -= world_facts
+
+			true_fact_list = [fact for fact in fact_list if fact in true_facts]
+			false_fact_list = ["~" + fact for fact in fact_list if fact in false_facts]
+			yield AnytimeResult(true_fact_list + false_fact_list, start + chunk_size >= len(worlds))
+
+		yield AnytimeResult(fact_list + ["~" + fact for fact in fact_list], True)
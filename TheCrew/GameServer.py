@@ -0,0 +1,262 @@
+import argparse
+import asyncio
+import itertools
+import json
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from GameConfig import GameConfig
+from GameManager import GameManager
+from TheCrew import deal_cards, generate_mission, generate_missions, get_real_world, initialise_kripke_model
+
+"""
+ABOUT:
+A local server that hosts many games of The Crew at the same time.
+Clients send one JSON request per line over TCP or a Unix socket and get one JSON response per line back.
+
+Requests:
+    {"command": "new"}                                          (optional: "config", "hands", and "mission", "missions" or "number_of_missions")
+    {"command": "state", "session": 1}
+    {"command": "hints", "session": 1}
+    {"command": "play", "session": 1, "card": 3}
+    {"command": "communicate", "session": 1, "agent": "b", "card": 4}
+    {"command": "close", "session": 1}
+
+Building kripke models and updating them is done in worker pools, so the event loop keeps answering other sessions.
+Sessions that are dealt the same hands share one initial kripke model, which is never changed after it is built.
+"""
+
+
+class GameSession:
+    """
+    One game hosted by the server
+    All moves of a session are handled one at a time through its lock
+    """
+
+    def __init__(self, session_id, game):
+        self.session_id = session_id
+        self.game = game
+        self.status = None
+        self.lock = asyncio.Lock()
+
+    def get_state(self):
+        """
+        Returns the public state of the game
+        """
+        game = self.game
+        return {
+            "session": self.session_id,
+            "hands": {agent: game.get_agent_hand(agent) for agent in game.agents},
+            "mission": game.mission,
+            "missions": game.missions,
+            "trick": game.current_trick.get_cards(),
+            "current_player": game.get_current_player_name(),
+            "communications": {agent: game.nr_of_communications[index] for index, agent in enumerate(game.agents)},
+            "status": self.status,
+        }
+
+    def get_hints(self):
+        """
+        Returns the common knowledge and the tricks the players yet to play know about
+        """
+        tricks = self.game.get_known_tricks()
+        return {
+            "session": self.session_id,
+            "common_knowledge": sorted(self.game.get_common_knowledge()),
+            "tricks": [trick.get_cards() for trick in tricks],
+            "winning_tricks": [trick.get_cards() for trick in tricks if self.game.is_winning_trick(trick)],
+        }
+
+    def play(self, card):
+        """
+        Plays a card of the current player and ends the trick once every player played
+        """
+        if self.status is not None:
+            raise ValueError("The game is over.")
+        if not self.game.is_valid_play(card):
+            raise ValueError("Invalid card. If they can, a player must follow suit.")
+
+        self.game.play_card(card)
+
+        if self.game.current_trick.get_nr_of_cards() == len(self.game.agents):
+            self.game.collect_trick()
+            self.status = self.game.get_mission_status()
+
+    def communicate(self, agent, card):
+        """
+        Lets an agent communicate one of their cards
+        """
+        if self.status is not None:
+            raise ValueError("The game is over.")
+        if agent not in self.game.agents:
+            raise ValueError(str(agent) + " is not a player.")
+        if not self.game.can_communicate(agent):
+            raise ValueError("This player can no longer communicate.")
+        if card not in self.game.get_agent_hand(agent):
+            raise ValueError("Player " + agent + " does not have that card.")
+
+        self.game.communicate(agent, card)
+
+
+class GameServer:
+    """
+    Hosts the game sessions and the cache of initial kripke models
+    """
+
+    def __init__(self, workers=4, model_cache_size=64):
+        self.sessions = {}
+        self.session_ids = itertools.count(1)
+        self.model_cache = OrderedDict()
+        self.model_cache_size = model_cache_size
+        self.model_pool = ProcessPoolExecutor(workers)
+        self.session_pool = ThreadPoolExecutor(workers)
+
+    async def get_initial_model(self, config, hand_cards):
+        """
+        Returns the initial kripke model for the dealt hands
+        The model is built in the process pool once and then shared by all sessions with the same table and deal
+        """
+        key = (json.dumps(config.to_dict()), tuple(tuple(hand) for hand in hand_cards))
+
+        if key in self.model_cache:
+            self.model_cache.move_to_end(key)
+        else:
+            loop = asyncio.get_running_loop()
+            self.model_cache[key] = loop.run_in_executor(self.model_pool, initialise_kripke_model, config, hand_cards)
+            if len(self.model_cache) > self.model_cache_size:
+                self.model_cache.popitem(last=False)
+
+        try:
+            return await asyncio.shield(self.model_cache[key])
+        except Exception:
+            self.model_cache.pop(key, None)
+            raise
+
+    def parse_mission(self, config, mission):
+        """
+        Returns the [agent, card] mission of a request, checked against the config
+        """
+        agent, card = mission[0], int(mission[1])
+        if agent not in config.agents or card not in config.deck:
+            raise ValueError("A mission has to be for one of the agents " + str(config.agents) + " and a card of the deck " + str(config.deck) + ".")
+        return [agent, card]
+
+    async def new_session(self, request):
+        """
+        Deals a new game, unless the hands are given, and starts a session for it
+        """
+        config = GameConfig.from_dict(request.get("config", {}))
+
+        if "hands" in request:
+            hand_cards = [sorted(int(card) for card in hand) for hand in request["hands"]]
+            if len(hand_cards) != len(config.agents) or any(len(hand) != config.hand_size for hand in hand_cards) \
+                    or sorted(card for hand in hand_cards for card in hand) != config.deck:
+                raise ValueError("The hands have to divide the deck " + str(config.deck) + " over " + str(len(config.agents)) + " players.")
+        else:
+            hand_cards = [sorted(hand) for hand in deal_cards(config.deck, len(config.agents))]
+
+        if "mission" in request:
+            mission = self.parse_mission(config, request["mission"])
+        elif "missions" in request:
+            mission = [self.parse_mission(config, single_mission) for single_mission in request["missions"]]
+            if not mission:
+                raise ValueError("A game needs at least one mission.")
+            if len(set(single_mission[1] for single_mission in mission)) != len(mission):
+                raise ValueError("The missions have to be for different cards.")
+        elif "number_of_missions" in request:
+            mission = generate_missions(config, int(request["number_of_missions"]))
+        else:
+            mission = generate_mission(config)
+
+        ks = await self.get_initial_model(config, hand_cards)
+
+        loop = asyncio.get_running_loop()
+        game = await loop.run_in_executor(
+            self.session_pool, GameManager, ks, config, [hand.copy() for hand in hand_cards], mission, get_real_world(hand_cards))
+
+        session = GameSession(next(self.session_ids), game)
+        self.sessions[session.session_id] = session
+        return session.get_state()
+
+    async def handle_request(self, request):
+        """
+        Handles one request and returns the response
+        """
+        if not isinstance(request, dict):
+            raise ValueError("A request has to be a JSON object.")
+        command = request.get("command")
+
+        if command == "new":
+            return await self.new_session(request)
+
+        session = self.sessions.get(request.get("session"))
+        if session is None:
+            raise ValueError("Unknown session.")
+
+        loop = asyncio.get_running_loop()
+        async with session.lock:
+            if command == "state":
+                return session.get_state()
+            elif command == "hints":
+                return await loop.run_in_executor(self.session_pool, session.get_hints)
+            elif command == "play":
+                await loop.run_in_executor(self.session_pool, session.play, int(request["card"]))
+                return session.get_state()
+            elif command == "communicate":
+                await loop.run_in_executor(self.session_pool, session.communicate, request["agent"], int(request["card"]))
+                return session.get_state()
+            elif command == "close":
+                del self.sessions[session.session_id]
+                return {"session": session.session_id, "closed": True}
+
+        raise ValueError("Unknown command " + str(command) + ".")
+
+    async def handle_client(self, reader, writer):
+        """
+        Answers the requests of one connection, one line at a time
+        """
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+
+            try:
+                response = await self.handle_request(json.loads(line))
+            except (ValueError, KeyError, TypeError, IndexError) as error:
+                response = {"error": str(error)}
+
+            writer.write((json.dumps(response) + "\n").encode())
+            await writer.drain()
+
+        writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765, unix_path=None):
+        """
+        Serves clients until cancelled
+        """
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle_client, path=unix_path)
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.model_pool.shutdown()
+            self.session_pool.shutdown()
+
+
+##### MAIN #####
+"""
+Start the server
+"""
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Host many games of The Crew at the same time.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="serve on this Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=4, help="size of the worker pools")
+    arguments = parser.parse_args()
+
+    asyncio.run(GameServer(arguments.workers).serve(arguments.host, arguments.port, arguments.unix))
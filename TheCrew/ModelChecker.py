@@ -0,0 +1,161 @@
+import argparse
+import ast
+import json
+import sys
+
+from mlsolver.formula import Atom, Box, Box_a, Box_D, Box_E, Box_star, Diamond, Diamond_a, Implies, Not, And, Or
+from mlsolver.kripke import FormulaCompiler, KripkeStructure, World
+
+from GameLog import Replayer, read_games
+from GameConfig import GameConfig
+from TheCrew import initialise_kripke_model
+
+"""
+ABOUT:
+Checks many modal formulas against one kripke model without writing a script against the game.
+The model is built from a logged game (the position after a given number of its moves, by default the start of the game,
+or the initial model when the log holds only a deal) or loaded from a model file written with --save. Formulas are read one per line, written as calls of the formula.py operators:
+
+    Box_a("a", Atom("b:3"))
+    Not(Box_E(["a", "b", "c"], Or(Atom("a:1"), Atom("b:1"))))
+
+Every formula is parsed once and evaluated in all worlds, and one JSON line is written per formula:
+
+    {"line": 1, "formula": "...", "true": 12, "false": 3, "valid": false, "false_worlds": [...]}
+
+Subformulas shared by the formulas of a batch are compiled and evaluated once, until the compiler holds cache_size subformulas.
+Formulas and results are streamed, so the memory used does not grow with the number of formulas.
+"""
+
+# The operators that may be called in a formula, by name
+OPERATORS = {operator.__name__: operator for operator in
+             (Atom, Box, Box_a, Box_D, Box_E, Box_star, Diamond, Diamond_a, Implies, Not, And, Or)}
+
+
+def parse_formula(text):
+    """
+    Returns the formula written in text as calls of the formula operators
+    Only operator calls, strings and lists or tuples of strings are accepted; anything else raises a ValueError
+    """
+    try:
+        tree = ast.parse(text.strip(), mode="eval")
+    except SyntaxError as error:
+        raise ValueError("Invalid syntax: " + str(error.msg) + ".")
+    return build_formula(tree.body)
+
+
+def build_formula(node):
+    """
+    Builds the formula of a parsed expression node
+    """
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [build_formula(element) for element in node.elts]
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in OPERATORS and not node.keywords:
+        return OPERATORS[node.func.id](*[build_formula(argument) for argument in node.args])
+    raise ValueError("Unsupported expression: " + ast.dump(node) + ".")
+
+
+def model_to_dict(ks):
+    """
+    Returns the worlds, with the atoms that hold in them, and the relations of the kripke model
+    """
+    return {
+        "worlds": [{"name": world.name, "true": sorted(atom for atom, value in world.assignment.items() if value)} for world in ks.worlds],
+        "relations": {agent: sorted(relation) for agent, relation in ks.relations.items()},
+    }
+
+
+def model_from_dict(values):
+    worlds = [World(world["name"], {atom: True for atom in world["true"]}) for world in values["worlds"]]
+    relations = {agent: set(tuple(pair) for pair in relation) for agent, relation in values["relations"].items()}
+    return KripkeStructure(worlds, relations)
+
+
+def load_logged_model(path, game_number=1, step=0):
+    """
+    Returns the kripke model of the given game in a log: its initial model when the log holds only the deal,
+    and otherwise the model after replaying the first step moves (plays, communications and tricks) of the game
+    After a trick is collected the atoms of its cards may be dropped from the model, see GameManager.retire_cards
+    """
+    with open(path) as file:
+        for number, events in enumerate(read_games(file), 1):
+            if number != game_number:
+                continue
+            if len(events) == 1:
+                return initialise_kripke_model(GameConfig.from_dict(events[0]["config"]), events[0]["h"])
+
+            replayer = Replayer()
+            game, moves = replayer.start_game(events)
+            if not 0 <= step <= len(moves):
+                raise ValueError("Game " + str(game_number) + " of " + path + " has " + str(len(moves)) + " moves.")
+            if step > 0:
+                for event, game, hints in replayer.replay(events[:len(events) - len(moves) + step]):
+                    pass
+            game.refine_kripke_model()
+            return game.kripke_model
+    raise ValueError("The log " + path + " holds fewer than " + str(game_number) + " games.")
+
+
+def check_formulas(ks, lines, output=sys.stdout, cache_size=10000, list_worlds=False):
+    """
+    Evaluates the formula on every line in all worlds of ks and writes one JSON line per formula
+    Lines that are empty or start with # are skipped; formulas that can not be parsed or evaluated are reported with an error
+    """
+    compiler = FormulaCompiler(ks)
+    world_names = [world.name for world in ks.worlds]
+
+    for number, line in enumerate(lines, 1):
+        text = line.strip()
+        if not text or text.startswith("#"):
+            continue
+
+        if len(compiler) > cache_size:
+            compiler.clear()
+        try:
+            evaluate = compiler.compile(parse_formula(text))
+            false_worlds = [name for name in world_names if not evaluate(name)]
+        except (ValueError, TypeError, KeyError, AttributeError) as error:
+            output.write(json.dumps({"line": number, "formula": text, "error": str(error)}) + "\n")
+            continue
+
+        result = {"line": number, "formula": text, "true": len(world_names) - len(false_worlds),
+                  "false": len(false_worlds), "valid": not false_worlds}
+        if list_worlds:
+            result["false_worlds"] = false_worlds
+        output.write(json.dumps(result) + "\n")
+
+
+##### MAIN #####
+"""
+Check the formulas from a file or stdin against a logged game or a saved model
+"""
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check modal formulas against a kripke model of The Crew.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--log", help="build the model of a game in this log")
+    source.add_argument("--model", help="load the model from a file written with --save")
+    parser.add_argument("--game", type=int, default=1, help="number of the game in the log")
+    parser.add_argument("--step", type=int, default=0, help="number of logged moves to replay before checking (default: the start of the game)")
+    parser.add_argument("--save", help="write the model to this file")
+    parser.add_argument("--formulas", help="file with one formula per line (default: stdin)")
+    parser.add_argument("--cache-size", type=int, default=10000, help="compiled subformulas kept between formulas")
+    parser.add_argument("--worlds", action="store_true", help="list the worlds in which each formula is false")
+    arguments = parser.parse_args()
+
+    if arguments.log:
+        ks = load_logged_model(arguments.log, arguments.game, arguments.step)
+    else:
+        with open(arguments.model) as file:
+            ks = model_from_dict(json.load(file))
+
+    if arguments.save:
+        with open(arguments.save, "w") as file:
+            json.dump(model_to_dict(ks), file)
+
+    if arguments.formulas:
+        with open(arguments.formulas) as file:
+            check_formulas(ks, file, cache_size=arguments.cache_size, list_worlds=arguments.worlds)
+    elif not arguments.save or not sys.stdin.isatty():
+        check_formulas(ks, sys.stdin, cache_size=arguments.cache_size, list_worlds=arguments.worlds)
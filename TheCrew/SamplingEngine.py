@@ -0,0 +1,175 @@
+import math
+import random
+import time
+
+"""
+ABOUT:
+An approximate knowledge engine for tables too large to enumerate every world of the kripke model.
+Instead of the worlds it draws deals uniformly from the same set: the deals in which at least one agent holds their real hand
+and that agree with every public announcement made so far.
+From these samples it estimates the common knowledge and how likely it is that the players yet to play can still win the trick.
+"""
+
+# Confidence used for all bounds of the estimates
+CONFIDENCE = 0.95
+Z_SCORE = 1.96
+
+
+class SamplingEstimate:
+	"""
+	The result of sampling: the facts found in all (or none) of the samples and how far they can be trusted
+	error_bound is the largest share of worlds, at the engine's confidence, that may contradict a reported fact
+	"""
+
+	def __init__(self, true_facts, false_facts, samples, complete):
+		self.true_facts = true_facts
+		self.false_facts = false_facts
+		self.samples = samples
+		self.complete = complete
+		self.error_bound = 1 - (1 - CONFIDENCE) ** (1 / samples) if samples > 0 else 1.0
+
+
+class SamplingEngine:
+	"""
+	Estimates common knowledge and trick winnability of a GameManager by sampling deals
+	At most sample_budget samples are drawn per question and sampling stops after time_budget seconds
+	"""
+
+	def __init__(self, sample_budget=2000, time_budget=0.2, seed=None):
+		self.sample_budget = sample_budget
+		self.time_budget = time_budget
+		self.random = random.Random(seed)
+		self.cache = {}
+
+	def get_class_size(self, game, anchor):
+		"""
+		Returns the number of deals in which the anchor agent holds their real hand and all announcements hold
+		"""
+		free_cards, capacities = self.get_free_cards(game, anchor)
+		size = math.factorial(len(free_cards))
+		for capacity in capacities.values():
+			size //= math.factorial(capacity)
+		return size
+
+	def get_free_cards(self, game, anchor):
+		"""
+		Returns the cards that are not fixed by the anchor's hand or an announcement,
+		and how many of them each other agent still has to receive
+		"""
+		fixed = {card: agent for agent, card in game.announcements}
+		anchor_hand = game.dealt_hands[game.agents.index(anchor)]
+		capacities = {agent: game.config.hand_size for agent in game.agents if agent != anchor}
+
+		free_cards = []
+		for card in game.deck:
+			if card in anchor_hand:
+				continue
+			if card in fixed:
+				capacities[fixed[card]] -= 1
+			else:
+				free_cards.append(card)
+		return free_cards, capacities
+
+	def sample_deal(self, game, anchors, weights):
+		"""
+		Draws one deal uniformly from the deals in which at least one of the anchors holds their real hand
+		A deal is drawn for an anchor chosen by the size of its class, and kept with a chance of one over the
+		number of anchors holding their real hand in it, so deals in several classes are not drawn too often.
+		Returns the deal as a dict from agent to a set of cards
+		"""
+		while True:
+			anchor = self.random.choices(anchors, weights)[0]
+			free_cards, capacities = self.get_free_cards(game, anchor)
+			self.random.shuffle(free_cards)
+
+			deal = {agent: set() for agent in game.agents}
+			deal[anchor] = set(game.dealt_hands[game.agents.index(anchor)])
+			for agent, card in game.announcements:
+				if card not in deal[anchor]:
+					deal[agent].add(card)
+			for agent, capacity in capacities.items():
+				deal[agent].update(free_cards[:capacity])
+				free_cards = free_cards[capacity:]
+
+			real_hands = 0
+			for agent in anchors:
+				if deal[agent] == set(game.dealt_hands[game.agents.index(agent)]):
+					real_hands += 1
+			if self.random.random() < 1 / real_hands:
+				return deal
+
+	def sample_deals(self, game, anchors):
+		"""
+		Returns the samples for the current announcements, drawing them within the budgets if needed
+		The samples are kept until the next announcement
+		"""
+		if not anchors:
+			anchors = game.agents
+		key = (len(game.announcements), tuple(anchors))
+		if key not in self.cache:
+			self.cache = {cached: value for cached, value in self.cache.items() if cached[0] == len(game.announcements)}
+
+			weights = [self.get_class_size(game, anchor) for anchor in anchors]
+			deadline = time.monotonic() + self.time_budget
+			deals = []
+			while len(deals) < self.sample_budget and time.monotonic() < deadline:
+				deals.append(self.sample_deal(game, anchors, weights))
+			self.cache[key] = deals
+		return self.cache[key]
+
+	def estimate_common_knowledge(self, game, anchors=None):
+		"""
+		Estimates which facts hold in all deals considered possible by the anchors (by default all agents)
+		"""
+		if anchors is None:
+			anchors = game.agents
+		deals = self.sample_deals(game, anchors)
+
+		true_facts = []
+		false_facts = []
+		for agent in game.agents:
+			for card in game.get_live_cards():
+				holds = [card in deal[agent] for deal in deals]
+				if all(holds):
+					true_facts.append(agent + ":" + str(card))
+				elif not any(holds):
+					false_facts.append(agent + ":" + str(card))
+
+		return SamplingEstimate(true_facts, false_facts, len(deals), len(deals) >= self.sample_budget)
+
+	def get_positive_common_knowledge(self, game, anchors=None):
+		return self.estimate_common_knowledge(game, anchors).true_facts
+
+	def get_common_knowledge(self, game):
+		estimate = self.estimate_common_knowledge(game)
+		return estimate.true_facts + ["~" + fact for fact in estimate.false_facts]
+
+	def estimate_winnability(self, game):
+		"""
+		Estimates the share of possible deals in which the players yet to play can still complete a winning trick
+		Returns the estimate together with the lower and upper bound of its Wilson confidence interval
+		"""
+		not_played_yet = game.player_order[game.current_trick.get_nr_of_cards():]
+		deals = self.sample_deals(game, not_played_yet)
+		if not deals:
+			return 0.0, 0.0, 1.0
+
+		played_cards = game.current_trick.get_cards()
+		for player in game.cards_won:
+			played_cards += player
+
+		winnable = 0
+		n = 0
+		deadline = time.monotonic() + self.time_budget
+		for deal in deals:
+			hands = [sorted(deal[player] - set(played_cards)) for player in not_played_yet]
+			if game.can_win_trick(hands):
+				winnable += 1
+			n += 1
+			if time.monotonic() > deadline:
+				break
+
+		share = winnable / n
+		centre = (share + Z_SCORE ** 2 / (2 * n)) / (1 + Z_SCORE ** 2 / n)
+		margin = Z_SCORE * math.sqrt(share * (1 - share) / n + Z_SCORE ** 2 / (4 * n ** 2)) / (1 + Z_SCORE ** 2 / n)
+		return share, max(0.0, centre - margin), min(1.0, centre + margin)
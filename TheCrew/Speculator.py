@@ -0,0 +1,85 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from mlsolver.formula import Atom
+
+"""
+ABOUT:
+Speculative announcements: while a player is deciding on their move, the kripke models that would follow
+from their possible plays and communications are already computed in a thread pool.
+Once the move is made the model is usually ready, and the other speculated models are discarded.
+"""
+
+
+class Speculator:
+	"""
+	Computes the models after possible announcements in the background and keeps them in an LRU cache
+	Entries are keyed by the model they start from, the announcing agent and the announced card
+	"""
+
+	def __init__(self, workers=2, cache_size=64):
+		self.executor = ThreadPoolExecutor(workers)
+		self.cache = OrderedDict()
+		self.cache_size = cache_size
+
+		# Freeing large models takes a while, so discarded models are freed in the pool while the next move is chosen
+		self.discarded = []
+
+	def get_key(self, model, agent, card):
+		return (id(model), model.version, agent, int(card))
+
+	def speculate(self, model, moves):
+		"""
+		Starts computing the model after each (agent, card) announcement in moves, in the given order
+		"""
+		if self.discarded:
+			self.executor.submit(self.discarded.clear)
+			self.discarded = []
+
+		for agent, card in moves:
+			key = self.get_key(model, agent, card)
+			if key in self.cache:
+				self.cache.move_to_end(key)
+				continue
+
+			# The model is kept with the future, so its id can not be reused while the entry is cached
+			future = self.executor.submit(model.solve, Atom(agent + ":" + str(card)))
+			self.cache[key] = (future, model)
+			if len(self.cache) > self.cache_size:
+				self.discard(*self.cache.popitem(last=False)[1])
+
+	def get(self, model, agent, card, timeout=None):
+		"""
+		Returns the model after agent announced card, or None if it was not speculated or is not done within timeout
+		All other entries are discarded, as the game moves on from model with this announcement
+		"""
+		entry = self.cache.pop(self.get_key(model, agent, card), None)
+		self.discard_stale()
+
+		if entry is None or entry[0].cancel():
+			return None
+		try:
+			return entry[0].result(timeout)
+		except TimeoutError:
+			return None
+
+	def discard_stale(self, model=None):
+		"""
+		Removes the entries that do not start from model (all entries without a model) and cancels those that have not started yet
+		"""
+		for key in list(self.cache):
+			if model is None or key[:2] != (id(model), model.version):
+				self.discard(*self.cache.pop(key))
+
+	def discard(self, future, model):
+		"""
+		Cancels the future if it has not started, and keeps it and its model until they can be freed in the background
+		"""
+		if future is not None:
+			future.cancel()
+		self.discarded.append((future, model))
+
+	def shutdown(self):
+		self.discard_stale()
+		self.discarded = []
+		self.executor.shutdown(wait=False)
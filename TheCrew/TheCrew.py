@@ -1,17 +1,30 @@
-import collections
+import math
+import os
 import random
-from itertools import permutations
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import combinations
 
-from mlsolver.kripke import World, KripkeStructure
+from mlsolver.kripke import EquivalenceRelation, World, KripkeStructure
 
+from GameConfig import GameConfig
 from GameManager import GameManager
+from SamplingEngine import CONFIDENCE
+from Speculator import Speculator
 
 """
 ABOUT:
 This program should simulate the logic of the card game the crew.
 The goals is to be able to do this for at least 3 players and a deck of at least 6 cards.
+The table (agents, suits, ranks per suit and trump suit) is described by a GameConfig, see GameConfig.py.
 """
 
+# Tables on which an agent considers at least this many deals possible build their starting model over a process pool
+# Merging the worlds of the shards costs the parent about 60% of generating them, plus starting the pool:
+# the 4 agent table of 12 cards (1680 deals per agent, 6603 worlds) takes 0.15 s serially and is not worth a pool,
+# the one of 16 cards (34650 deals per agent, 138183 worlds) takes 3.8 s serially, of which merging would take 2.4 s.
+SHARDING_THRESHOLD = 10000
+
 
 def deal_cards(deck, number_of_agents):
     """
@@ -21,134 +34,228 @@ def deal_cards(deck, number_of_agents):
     return [deck[agent::number_of_agents] for agent in range(number_of_agents)]
 
 
-def generate_accessible_worlds(possible_worlds, hand_cards):
+def generate_accessible_deals(config, hand_cards):
     """
-    Generates the worlds accessible given the current hand
+    Generates the deals accessible given the current hands
+    A deal is accessible if at least one agent holds the same hand as in the real deal, as that agent then considers it possible.
+    For each agent we keep their hand and divide the remaining cards over the other agents in every possible way.
+    Deals accessible for several agents are only generated once.
     """
-    accessible_worlds = []
-    nr_of_agents = len(hand_cards)
-    nr_of_cards_in_hand = len(hand_cards[0])
+    deals = {}
 
-    # check if for at least one agent a 'possible world' is accessible, if not don't include it in the kripke model
-    # accessible becomes true if for at least one agent all its cards in his hand match another state
-    for world in possible_worlds:
-        accessible = False
-        for agent in range(nr_of_agents):
-            same_hand = True
-            for card in range(nr_of_cards_in_hand):
-                if not world[(agent) * nr_of_cards_in_hand + card] == hand_cards[agent][card]:
-                    same_hand = False
-            # if all cards in this agents hand match, then this world is accessible from the real world
-            if same_hand:
-                accessible = True
-        if accessible:
-            accessible_worlds.append(world)
+    for agent in range(len(config.agents)):
+        remaining_cards = [card for card in config.deck if card not in hand_cards[agent]]
+        other_agents = [other for other in range(len(config.agents)) if other != agent]
 
-    return accessible_worlds
+        for other_hands in divide_cards(remaining_cards, len(other_agents), config.hand_size):
+            deal = [None] * len(config.agents)
+            deal[agent] = tuple(sorted(hand_cards[agent]))
+            for other, hand in zip(other_agents, other_hands):
+                deal[other] = hand
+            deals.setdefault(tuple(deal), None)
 
+    return list(deals)
 
-def same_elements(list1, list2):
-    return collections.Counter(list1) == collections.Counter(list2)
 
+def divide_cards(cards, number_of_hands, hand_size):
+    """
+    Yields every way to divide the cards over a number of hands of hand_size cards, each hand as a sorted tuple
+    """
+    if number_of_hands == 0:
+        yield ()
+        return
+    for hand in combinations(cards, hand_size):
+        rest = [card for card in cards if card not in hand]
+        for other_hands in divide_cards(rest, number_of_hands - 1, hand_size):
+            yield (hand,) + other_hands
 
-def generate_worlds(accessible_worlds, deck):
+
+def get_world_name(hand_cards):
     """
-    For each permutation we create a world.
-    We get the name by joining the values of the cards into a single string.
-    We then get the truth values of the world by going over the cards in the world and marking:
-    - The first third of the cards as belonging to agent a
-    - The second third of the cards as belonging to agent b
-    - The final third of the cards as belonging to agent c
-    After that we check the world truth values against those of the other worlds.
-    If the world does not exist yet we add it to the worlds list
+    Returns the name of the world of a deal
+    The cards of each hand are sorted, so a deal has one name no matter the order of the hands
+    """
+    return "|".join(",".join(str(card) for card in sorted(hand)) for hand in hand_cards)
+
+
+def generate_worlds(config, deals):
+    """
+    For each deal we create a world.
+    We get the name from the cards in the hands of the agents.
+    We then get the truth values of the world by marking each card as belonging to the agent holding it.
     """
     worlds = []
 
-    for world in accessible_worlds:
-        world_name = ''.join(str(card) for card in world)
+    for deal in deals:
         world_truth_values = {}
-        for card in world:
-            if world.index(card) < len(deck) / 3:
-                world_truth_values["a:" + str(card)] = True
-            elif world.index(card) < len(deck) / 1.5:
-                world_truth_values["b:" + str(card)] = True
-            else:
-                world_truth_values["c:" + str(card)] = True
-
-        duplicate = False
-        for checker in worlds:
-            curr_world = list(world_truth_values.keys())
-            checker = list(checker.assignment.keys())
-            if same_elements(curr_world, checker):
-                duplicate = True
-        if not duplicate:
-            worlds.append(World(world_name, world_truth_values))
+        for agent, hand in zip(config.agents, deal):
+            for card in hand:
+                world_truth_values[agent + ":" + str(card)] = True
+        worlds.append(World(get_world_name(deal), world_truth_values))
 
     return worlds
 
 
-def initialise_worlds(agents, deck, hand_cards):
+def initialise_worlds(config, hand_cards):
     """
-    Generates the starting worlds of the Kripke model based on the agents and deck
-    First we make a list of all possible permutations of the deck
-    From these permutations we then gather all of the ones that are accessible given the current hand cards.
-    Finally we generate the worlds in the way needed to use them later
+    Generates the starting worlds of the Kripke model based on the configuration and the dealt hands
+    First we gather all deals that are accessible given the current hand cards.
+    Then we generate the worlds in the way needed to use them later
     """
-    possible_worlds = list(permutations(deck, len(deck)))
-    accessible_worlds = generate_accessible_worlds(possible_worlds, hand_cards)
-    worlds = generate_worlds(accessible_worlds, deck)
+    deals = generate_accessible_deals(config, hand_cards)
+    worlds = generate_worlds(config, deals)
 
     return worlds
 
 
-def initialise_relations(agents, deck, worlds):
+def get_agent_hand_in_world(agent, world):
+    """
+    Returns the cards an agent holds in a world
+    """
+    return frozenset(fact for fact, value in world.assignment.items() if value and fact.split(":")[0] == agent)
+
+
+def initialise_relations(config, worlds):
     """
     Generates the starting relations of the Kripke model based on the starting worlds
-    We first declare three empty sets for the agents.
-    We then go over each world combination for each agent.
-    We then add a relation for the agent for each world combination where the agent has the same cards.
+    For each agent we group the worlds by the hand the agent holds in them.
+    We then relate the worlds within each group for the agent.
     (which is the starting knowledge of each agent, as each agent knows their own hand)
     """
-    relations = {
-        "a": set(),
-        "b": set(),
-        "c": set()
-    }
-
-    for agent in agents:
-        for origin_world in worlds:
-            for destination_world in worlds:
-                if agent == "a" and origin_world.name[:int(len(deck) / 3)] == destination_world.name[
-                                                                              :int(len(deck) / 3)]:
-                    relations["a"].add((origin_world.name, destination_world.name))
-                elif agent == "b" and origin_world.name[
-                                      int(len(deck) / 3):int(len(deck) / 1.5)] == destination_world.name[
-                                                                                  int(len(deck) / 3):int(
-                                                                                      len(deck) / 1.5)]:
-                    relations["b"].add((origin_world.name, destination_world.name))
-                elif agent == "c" and origin_world.name[int(len(deck) / 1.5):] == destination_world.name[
-                                                                                  int(len(deck) / 1.5):]:
-                    relations["c"].add((origin_world.name, destination_world.name))
-
-    return relations
-
-
-def initialise_kripke_model(agents, deck, hand_cards):
-    """
-    Generates the starting kripke model based on the agents and deck used
+    classes = {agent: {} for agent in config.agents}
+
+    for agent in config.agents:
+        for world in worlds:
+            classes[agent].setdefault(get_agent_hand_in_world(agent, world), []).append(world.name)
+
+    return relate_classes(classes)
+
+
+def relate_classes(classes):
+    """
+    Generates the relations from the worlds grouped per agent by the hand the agent holds in them
+    Each relation is kept as its groups, see EquivalenceRelation, as the pairs of all worlds within a group far outnumber the worlds
+    """
+    return {agent: EquivalenceRelation(worlds_by_hand.values()) for agent, worlds_by_hand in classes.items()}
+
+
+def count_deals_per_agent(config):
+    """
+    Returns the number of deals an agent considers possible: the ways to divide the other cards over the other agents
+    """
+    other_agents = len(config.agents) - 1
+    return math.factorial(other_agents * config.hand_size) // math.factorial(config.hand_size) ** other_agents
+
+
+def get_shards(config, hand_cards):
+    """
+    Divides the accessible deals into shards of (anchor agent, hand of the first other agent)
+    A shard holds the deals in which the anchor holds their real hand and the first other agent holds the given hand.
+    """
+    shards = []
+    for agent in range(len(config.agents)):
+        remaining_cards = [card for card in config.deck if card not in hand_cards[agent]]
+        for hand in combinations(remaining_cards, config.hand_size):
+            shards.append((agent, hand))
+    return shards
+
+
+def generate_shard(config, hand_cards, shard):
+    """
+    Generates the worlds of a shard and groups their names per agent by the hand the agent holds in them
+    A deal in which several agents hold their real hand only belongs to the shard of the first of those agents,
+    so the shards together hold every accessible deal once, in the same order as generate_accessible_deals.
+    """
+    agent, first_hand = shard
+    real_hands = [tuple(sorted(hand)) for hand in hand_cards]
+    other_agents = [other for other in range(len(config.agents)) if other != agent]
+    remaining_cards = [card for card in config.deck if card not in hand_cards[agent] and card not in first_hand]
+
+    deals = []
+    for other_hands in divide_cards(remaining_cards, len(other_agents) - 1, config.hand_size):
+        deal = [None] * len(config.agents)
+        deal[agent] = real_hands[agent]
+        for other, hand in zip(other_agents, (first_hand,) + other_hands):
+            deal[other] = hand
+        if any(deal[earlier] == real_hands[earlier] for earlier in range(agent)):
+            continue
+        deals.append(tuple(deal))
+
+    worlds = generate_worlds(config, deals)
+    classes = {agent: {} for agent in config.agents}
+    for deal, world in zip(deals, worlds):
+        for agent, hand in zip(config.agents, deal):
+            classes[agent].setdefault(hand, []).append(world.name)
+
+    return worlds, classes
+
+
+def initialise_sharded_model(config, hand_cards, processes):
+    """
+    Generates the starting worlds and relations over a process pool, one shard at a time
+    The shards are merged in order, so the worlds come out in the same order on every run.
+    """
+    shards = get_shards(config, hand_cards)
+    worlds = []
+    classes = {agent: {} for agent in config.agents}
+
+    with ProcessPoolExecutor(processes) as executor:
+        chunksize = max(1, len(shards) // (processes * 4))
+        results = executor.map(generate_shard, [config] * len(shards), [hand_cards] * len(shards), shards, chunksize=chunksize)
+        for shard_worlds, shard_classes in results:
+            worlds += shard_worlds
+            for agent, worlds_by_hand in shard_classes.items():
+                for hand, world_names in worlds_by_hand.items():
+                    classes[agent].setdefault(hand, []).extend(world_names)
+
+    return worlds, relate_classes(classes)
+
+
+def initialise_kripke_model(config, hand_cards, processes=None):
+    """
+    Generates the starting kripke model based on the configuration and the dealt hands
     We first generate the starting worlds.
     We then generate the starting relations of those worlds.
     We then combine these into a kripke structure
+    On larger tables the worlds are generated in shards over a pool of processes (by default one per core)
     """
-    worlds = initialise_worlds(agents, deck, hand_cards)
+    if processes is None:
+        processes = os.cpu_count() or 1
 
-    relations = initialise_relations(agents, deck, worlds)
+    if processes > 1 and count_deals_per_agent(config) >= SHARDING_THRESHOLD:
+        worlds, relations = initialise_sharded_model(config, [list(hand) for hand in hand_cards], processes)
+    else:
+        worlds = initialise_worlds(config, hand_cards)
+        relations = initialise_relations(config, worlds)
 
     ks = KripkeStructure(worlds, relations)
 
     return ks
 
 
+def get_real_world(hand_cards):
+    """
+    Returns the name of the world in which the cards are dealt as in hand_cards
+    """
+    return get_world_name(hand_cards)
+
+
+def create_game(config, hand_cards, mission, event_log=None, knowledge_engine=None, time_budget=None, speculator=None):
+    """
+    Builds the starting kripke model and the game manager for a deal
+    This includes the announcement of the commander, so it can be run in the background before the game starts
+    With a knowledge engine (see SamplingEngine) no kripke model is built at all
+    With a time budget the announcements and hints of each move are computed for at most that many seconds
+    With a speculator the models after the possible moves are computed while the players decide
+    """
+    ks = None
+    if knowledge_engine is None:
+        ks = initialise_kripke_model(config, hand_cards)
+    real_world = get_real_world(hand_cards)
+
+    return GameManager(ks, config, hand_cards, mission, real_world, event_log=event_log, knowledge_engine=knowledge_engine, time_budget=time_budget, speculator=speculator)
+
+
 def get_list_of_facts(ks):
     """
     Creates a complete list of all facts present in the model currently
@@ -161,27 +268,52 @@ def get_list_of_facts(ks):
     return list(dict.fromkeys(fact_list))
 
 
-def generate_mission(agents, deck):
+def generate_mission(config):
     """
-    Randomly selects an agent and a card
+    Randomly selects an agent and a card that is not a trump card
     The mission indicates which agent should end up with which card
     """
-    mission_agent = random.choice(agents)
-    mission_card = random.choice(deck)
-    while (mission_card / len(deck)) > 0.67:
-        mission_card = random.choice(deck)
+    mission_agent = random.choice(config.agents)
+    mission_card = random.choice(config.deck)
+    while config.get_card_suit(mission_card) == config.trump_suit:
+        mission_card = random.choice(config.deck)
     return [mission_agent, mission_card]
 
 
-def print_rules():
+def generate_missions(config, number_of_missions):
+    """
+    Randomly selects several missions, each for a different card that is not a trump card
+    All of them have to be completed to pass the game
+    """
+    mission_cards = [card for card in config.deck if config.get_card_suit(card) != config.trump_suit]
+    if not 1 <= number_of_missions <= len(mission_cards):
+        raise ValueError("The number of missions has to be between 1 and " + str(len(mission_cards)) + ", the number of cards that are not trump cards.")
+
+    missions = []
+    while len(missions) < number_of_missions:
+        mission = generate_mission(config)
+        if mission[1] not in [other_mission[1] for other_mission in missions]:
+            missions.append(mission)
+    return missions
+
+
+def print_rules(config=None):
     """
     A function which prints the rules of the game and gives a short explanation of what this program does.
     """
+    if config is None:
+        config = GameConfig()
     print("")
     print("Rules and Explanation:")
     print("In this version of The Crew, the players work together to make sure a specific player gets a specific card.")
-    print(
-        "The cards are numbered 1 to 6. Cards 1 and 2 are of suit 1, cards 3 and 4 are of suit 2 and cards 5 and 6 are trump cards.")
+    print("The cards are numbered 1 to " + str(len(config.deck)) + ".", end="")
+    for suit in config.suits:
+        suit_cards = config.get_suit_cards(suit)
+        if suit == config.trump_suit:
+            print(" Cards " + str(suit_cards[0]) + " to " + str(suit_cards[-1]) + " are trump cards.", end="")
+        else:
+            print(" Cards " + str(suit_cards[0]) + " to " + str(suit_cards[-1]) + " are of " + suit + ".", end="")
+    print("")
     print("")
     print(
         "The game is played in rounds called tricks. In a trick each player plays one card. The first card played determines the suit of the trick.")
@@ -216,22 +348,43 @@ def game_loop(game):
 
     while mission_ongoing:
 
-        print("Today's mission is for player " + game.mission[0] + " to obtain card number", game.mission[1])
+        for mission in game.missions:
+            print("Today's mission is for player " + mission[0] + " to obtain card number", mission[1])
         print("")
 
         print("The hands are currently as follows:")
-        for i in range(3):
+        for i in range(len(game.agents)):
             print("    Hand of player " + game.agents[i] + ":", game.hand_cards[i])
         print("")
 
-        game.is_game_winnable()
+        # With a time budget the hints are computed until the deadline of this move, and continued next move
+        deadline = game.get_deadline()
+        if not game.refine_kripke_model(deadline):
+            print("Not all announcements could be processed in time, the players may know more than shown.")
+            print("")
+
+        game.is_game_winnable(deadline)
 
+        for agent in game.agents:
+            knows_winnable = game.agent_knows_winnable_until(agent, deadline)
+            if knows_winnable.value and knows_winnable.complete:
+                print("Player " + agent + " should know that the mission can be completed in this trick.")
+            elif knows_winnable.value:
+                print("Player " + agent + " may know that the mission can be completed in this trick (not all worlds were checked in time).")
+
+        common_knowledge = game.get_common_knowledge_until(deadline)
         print("This is the current common knowledge:")
-        for fact in sorted(game.get_common_knowledge()):
+        if common_knowledge.error_bound > 0:
+            print("    (estimated from sampled deals: with " + str(round(100 * CONFIDENCE)) + "% confidence each of these facts fails in at most "
+                  + str(round(100 * common_knowledge.error_bound, 1)) + "% of the possible deals)")
+        elif not common_knowledge.complete:
+            print("    (not all worlds were checked in time, some of these facts may not be common knowledge)")
+        for fact in sorted(common_knowledge.value):
+            player, card = fact.lstrip("~").split(":")
             if fact[0] != "~":
-                print("    Player " + fact[0] + " was dealt card number", fact[2])
+                print("    Player " + player + " was dealt card number", card)
             else:
-                print("    Player " + fact[1] + " was not dealt card number", fact[3])
+                print("    Player " + player + " was not dealt card number", card)
         print("")
 
         print("The current trick has these cards in it:")
@@ -241,6 +394,9 @@ def game_loop(game):
         print("It is the turn of player " + game.get_current_player_name())
         print("")
 
+        # While the move is chosen, the models after the possible moves are computed in the background
+        game.speculate_moves()
+
         action = input(
             "Which action do you wish to perform? (type \"play\" to play a card, \"com\" to communicate a card or \"quit\" to quit)\n")
         print("")
@@ -256,7 +412,7 @@ def game_loop(game):
             break
 
         elif action == "rules":
-            print_rules()
+            print_rules(game.config)
 
         else:
             print("Invalid action, please retry.\n")
@@ -268,49 +424,68 @@ def game_loop(game):
         print("")
 
 
-def The_Crew_game():
+def The_Crew_game(event_log=None, config=None, knowledge_engine=None, time_budget=None, speculate=True, number_of_missions=1):
     """
-    We initialise the Kripke model based on the number of agents, "cards" in the deck and the cards in the hands of the agents
-    Cards can be defined as suit 1 (1,2), suit 2 (3,4), trump suit(5,6).
+    We initialise the Kripke model based on the game configuration and the cards in the hands of the agents
+    By default cards can be defined as suit 1 (1,2), suit 2 (3,4), trump suit(5,6).
+    If an event log is given, every action of the game is appended to it.
+    If a knowledge engine is given, it answers the knowledge questions instead of a Kripke model.
+    If a time budget is given, the hints of each move are computed for at most that many seconds.
+    Unless speculate is False, the models after the possible moves are computed while waiting for input.
+    With more than one mission, all of them have to be completed.
+    The Kripke model is built in the background while the welcome and the rules are shown.
     """
-    print("")
-    print("Initializing Kripke model, this may take a few seconds")
-
-    agents = ["a","b","c"]
-    deck = [1,2,3,4,5,6]
-    communications_per_agent = 1
-
-    hand_a, hand_b, hand_c = deal_cards(deck, len(agents))
-    hand_cards = [hand_a, hand_b, hand_c]
-
-    ks = initialise_kripke_model(agents, deck, hand_cards)
-    mission = generate_mission(agents, deck)
+    if config is None:
+        config = GameConfig()
 
-    real_world = []
+    hand_cards = deal_cards(config.deck, len(config.agents))
 
-    for hand in hand_cards:
-        for card in hand:
-            real_world.append(str(card))
+    if number_of_missions == 1:
+        mission = generate_mission(config)
+    else:
+        mission = generate_missions(config, number_of_missions)
 
-    real_world = "".join(real_world)
+    speculator = None
+    if speculate and knowledge_engine is None:
+        speculator = Speculator()
 
-    game = GameManager(ks, agents, deck, hand_cards, mission, communications_per_agent, real_world)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending_game = executor.submit(create_game, config, hand_cards, mission, event_log, knowledge_engine, time_budget, speculator)
 
-    print("""
+        print("""
     +--------------------+
     |     Welcome to     |
     |                    |
     |      THE CREW      |
     +--------------------+
 """)
-    print("For rules and explanation, type: \"rules\"")
-    print("")
+        print("For rules and explanation, type: \"rules\"")
+        print("")
+
+        if input("Press enter to start the game.\n") == "rules":
+            print_rules(config)
+
+        if not pending_game.done():
+            print("Initializing Kripke model, this may take a few seconds")
+        game = pending_game.result()
 
-    game_loop(game)
+    try:
+        game_loop(game)
+    finally:
+        if speculator is not None:
+            speculator.shutdown()
 
 
 ##### MAIN #####
 """
 Start the game
+Pass a file name to append the events of the game to that log
 """
-The_Crew_game()
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        from GameLog import GameLog
+
+        with open(sys.argv[1], "a") as log_file:
+            The_Crew_game(GameLog(log_file))
+    else:
+        The_Crew_game()
@@ -1,8 +1,8 @@
 
 class Trick:
-	def __init__(self, trick_suit = None, cards_in_trick = []):
+	def __init__(self, trick_suit = None, cards_in_trick = None):
 		self.trick_suit = trick_suit
-		self.cards_in_trick = cards_in_trick
+		self.cards_in_trick = cards_in_trick if cards_in_trick is not None else []
 		self.nr_of_cards_in_trick = 0
 
 	def reset(self):
@@ -19,6 +19,11 @@ class Atom:
             if world.name == world_to_test:
                 return world.assignment.get(self.name, False)
 
+    def compile(self, compiler):
+        """Compiles the variable into a flat evaluator of the given compiler.
+        """
+        return compiler.atom(self.name)
+
     def __eq__(self, other):
         return isinstance(other, Atom) and other.name == self.name
 
@@ -41,6 +46,9 @@ class Box:
                 result = result and self.inner.semantic(ks, relation[1])
         return result
 
+    def compile(self, compiler):
+        return compiler.box(None, compiler.compile(self.inner))
+
     def __eq__(self, other):
         return isinstance(other, Box) and self.inner == other.inner
 
@@ -67,6 +75,9 @@ class Box_a:
                 result = result and self.inner.semantic(ks, relation[1])
         return result
 
+    def compile(self, compiler):
+        return compiler.box(self.agent, compiler.compile(self.inner))
+
     # TODO
     def __eq__(self, other):
         raise NotImplementedError
@@ -92,6 +103,13 @@ class Box_star:
             f = And(f, Box_a(agents, self.inner))
         return f.semantic(ks, world_to_test)
 
+    def compile(self, compiler):
+        inner = compiler.compile(self.inner)
+        f = inner
+        for agents in compiler.ks.relations:
+            f = compiler.conjunction(f, compiler.box(agents, inner))
+        return f
+
     # TODO
     def __eq__(self, other):
         raise NotImplementedError
@@ -101,6 +119,62 @@ class Box_star:
         raise NotImplementedError
 
 
+class Box_E:
+    """
+    Describes the everybody knows operator E_G of modal logic formula and it's semantics for a group of agents
+    Semantic(Box_E phi) = Box_a phi and Box_b phi ... for all agents in the group
+    """
+
+    def __init__(self, agents, inner):
+        self.inner = inner
+        self.agents = agents
+
+    def semantic(self, ks, world_to_test):
+        for agent in self.agents:
+            if not Box_a(agent, self.inner).semantic(ks, world_to_test):
+                return False
+        return True
+
+    def compile(self, compiler):
+        inner = compiler.compile(self.inner)
+        f = compiler.TRUE
+        for agent in self.agents:
+            f = compiler.conjunction(f, compiler.box(agent, inner))
+        return f
+
+    def __eq__(self, other):
+        return isinstance(other, Box_E) and set(self.agents) == set(other.agents) and self.inner == other.inner
+
+    def __str__(self):
+        return "E_{" + ",".join(sorted(self.agents)) + "}(" + str(self.inner) + ")"
+
+
+class Box_D:
+    """
+    Describes the distributed knowledge operator D_G of modal logic formula and it's semantics for a group of agents
+    The box is taken over the intersection of the relations of all agents in the group
+    """
+
+    def __init__(self, agents, inner):
+        self.inner = inner
+        self.agents = agents
+
+    def semantic(self, ks, world_to_test):
+        result = True
+        for world in ks.distributed_successors(self.agents).get(world_to_test, ()):
+            result = result and self.inner.semantic(ks, world)
+        return result
+
+    def compile(self, compiler):
+        return compiler.distributed_box(self.agents, compiler.compile(self.inner))
+
+    def __eq__(self, other):
+        return isinstance(other, Box_D) and set(self.agents) == set(other.agents) and self.inner == other.inner
+
+    def __str__(self):
+        return "D_{" + ",".join(sorted(self.agents)) + "}(" + str(self.inner) + ")"
+
+
 class Diamond:
     """
     Describes diamond operator of modal logic formula and it's semantics
@@ -116,6 +190,9 @@ class Diamond:
                 result = result or self.inner.semantic(ks, relation[1])
         return result
 
+    def compile(self, compiler):
+        return compiler.diamond(None, compiler.compile(self.inner))
+
     def __eq__(self, other):
         return isinstance(other, Diamond) and self.inner == other.inner
 
@@ -142,6 +219,9 @@ class Diamond_a:
                 result = result or self.inner.semantic(ks, relation[1])
         return result
 
+    def compile(self, compiler):
+        return compiler.diamond(self.agent, compiler.compile(self.inner))
+
     # TODO
     def __eq__(self, other):
         raise NotImplementedError
@@ -163,6 +243,10 @@ class Implies:
     def semantic(self, ks, world_to_test):
         return not self.left.semantic(ks, world_to_test) or self.right.semantic(ks, world_to_test)
 
+    def compile(self, compiler):
+        return compiler.disjunction(compiler.negation(compiler.compile(self.left)),
+                                    compiler.compile(self.right))
+
     def __eq__(self, other):
         return self.left == other.left and self.right == other.right
 
@@ -181,6 +265,9 @@ class Not:
     def semantic(self, ks, world_to_test):
         return not self.inner.semantic(ks, world_to_test)
 
+    def compile(self, compiler):
+        return compiler.negation(compiler.compile(self.inner))
+
     def __eq__(self, other):
         return self.inner == other.inner
 
@@ -200,6 +287,9 @@ class And:
     def semantic(self, ks, world_to_test):
         return self.left.semantic(ks, world_to_test) and self.right.semantic(ks, world_to_test)
 
+    def compile(self, compiler):
+        return compiler.conjunction(compiler.compile(self.left), compiler.compile(self.right))
+
     def __eq__(self, other):
         return self.left == other.left and self.right == other.right
 
@@ -219,6 +309,9 @@ class Or:
     def semantic(self, ks, world_to_test):
         return self.left.semantic(ks, world_to_test) or self.right.semantic(ks, world_to_test)
 
+    def compile(self, compiler):
+        return compiler.disjunction(compiler.compile(self.left), compiler.compile(self.right))
+
     def __eq__(self, other):
         return self.left == other.left and self.right == other.right
 
@@ -4,10 +4,59 @@ Provides a tool to model Kripke structures and solve them in addition to a
 modal logic formula.
 """
 
-import copy
+import multiprocessing
+import os
+import threading
 
+from collections import deque
+from collections.abc import Set
 from itertools import chain, combinations
 
+# Fingerprints are sums of item hashes modulo this number
+FINGERPRINT_MODULUS = 2 ** 64
+
+# Models with at least this many worlds are checked in a process pool.
+# Forking a pool costs about 50 ms, less than a single box formula takes
+# to evaluate in 5000 worlds of a game model (the 4 agent table has 6603),
+# so smaller models are faster to check serially.
+# The formula is compiled before forking, which is not sped up by the pool.
+PARALLEL_THRESHOLD = 5000
+
+# Compiled formula of the pool a forked worker of nodes_not_follow_formula belongs to
+_shared_evaluator = None
+
+
+def product_world_name(world_name, event_name):
+    """Returns the name of the world of a product update in which event
+    happened in world.
+    """
+    return world_name + "@" + event_name
+
+
+def _is_propositional(key):
+    """Returns true iff the compiled formula with this key contains no modal
+    operator, so its truth in a world does not depend on other worlds.
+    """
+    if key[0] in ("box", "diamond", "distributed_box", "opaque"):
+        return False
+    return all(_is_propositional(part) for part in key[1:] if isinstance(part, tuple))
+
+
+def _set_shared_evaluator(evaluator):
+    """Initialises a forked worker process with the compiled formula of its
+    pool. Forked processes inherit the initializer arguments, so the
+    evaluator is not pickled.
+    """
+    global _shared_evaluator
+    _shared_evaluator = evaluator
+
+
+def _nodes_not_follow_formula_in_chunk(chunk):
+    """Checks one chunk of world names against the compiled formula
+    inherited by the forked worker process.
+    """
+    return [name for name in chunk if not _shared_evaluator(name)]
+
 
 class KripkeStructure:
     """
@@ -21,52 +70,152 @@ class KripkeStructure:
             self.relations = relations
         else:
             raise TypeError
+        # Incremented whenever worlds are removed, invalidates cached relations
+        self.version = 0
+        self._fingerprint = None
+        self._successors = {}
+        self._successors_version = 0
 
     def solve(self, formula):
         """Returns a Kripke structure with minimum sub set of nodes, that each
         of it's nodes forces a given formula.
+        A formula without modal operators holds in a world regardless of the
+        other worlds, so then exactly the worlds where it fails are removed
+        instead of searching all sub sets.
         """
+        failing = self._failing_if_propositional(formula)
+        if failing is not None:
+            return self.restrict_to(self._world_names() - failing)
+
+        names = self._world_names()
         for i, subset in enumerate(self.get_power_set_of_worlds()):
-            ks = KripkeStructure(self.worlds.copy(), copy.deepcopy(self.relations))
-            for element in subset:
-                ks.remove_node_by_name(element)
+            ks = self.restrict_to(names.difference(subset))
             if ks.nodes_not_follow_formula(formula) == []:
                 return ks
 
+    def solve_steps(self, formula, chunk_size=1000):
+        """Yields the names of the worlds that solve removes, a chunk of
+        worlds at a time, so the caller can stop between chunks and continue
+        later. A formula with modal operators is solved at once and all
+        removed worlds are yielded in one step.
+        """
+        evaluate = self.compile(formula)
+        if not _is_propositional(evaluate.key):
+            yield self._world_names() - self.solve(formula)._world_names()
+            return
+        for start in range(0, len(self.worlds), chunk_size):
+            yield {world.name for world in self.worlds[start:start + chunk_size]
+                   if not evaluate(world.name)}
+
+    def _failing_if_propositional(self, formula):
+        """Returns the set of worlds in which formula does not hold if it has
+        no modal operators, and None otherwise.
+        """
+        evaluate = self.compile(formula)
+        if not _is_propositional(evaluate.key):
+            return None
+        return {world.name for world in self.worlds if not evaluate(world.name)}
+
+    def _world_names(self):
+        return {world.name for world in self.worlds}
+
     def remove_node_by_name(self, node_name):
         """Removes ONE node of Kripke frame, therefore we can make knowledge
         base consistent with announcement.
         """
-        for world in self.worlds.copy():
-            if node_name == world.name:
-                self.worlds.remove(world)
+        self.remove_worlds([node_name])
+
+    def remove_worlds(self, node_names):
+        """Removes all named nodes of the Kripke frame and every relation
+        that starts or ends in one of them, in one pass over the worlds and
+        relations.
+        """
+        names = set(node_names)
+        self.version += 1
+        removed_hash = 0
+
+        kept_worlds = []
+        for world in self.worlds:
+            if world.name in names:
+                removed_hash += hash(world)
+            else:
+                kept_worlds.append(world)
+        self.worlds[:] = kept_worlds
+
+        for key, value in self._relations_by_agent().items():
+            if isinstance(value, EquivalenceRelation):
+                # The removed pairs are only listed to keep the fingerprint
+                removed = value.pairs_of(names) if self._fingerprint is not None else ()
+                value.remove_worlds(names)
+            else:
+                removed = {(start_node, end_node) for (start_node, end_node) in value
+                           if start_node in names or end_node in names}
+                value -= removed
+            for (start_node, end_node) in removed:
+                removed_hash += hash((key, start_node, end_node))
+
+        if self._fingerprint is not None:
+            self._fingerprint = (self._fingerprint - removed_hash) % FINGERPRINT_MODULUS
+
+    def restrict_to(self, node_names):
+        """Returns a Kripke structure with only the named nodes of this one
+        and the relations between them, leaving this structure as it is.
+        """
+        names = set(node_names)
+        worlds = [world for world in self.worlds if world.name in names]
+        restricted = {}
+        for key, value in self._relations_by_agent().items():
+            if isinstance(value, EquivalenceRelation):
+                restricted[key] = value.restrict_to(names)
+            else:
+                restricted[key] = {(start_node, end_node) for (start_node, end_node) in value
+                                   if start_node in names and end_node in names}
+        if not isinstance(self.relations, dict):
+            restricted = restricted[None]
+        return KripkeStructure(worlds, restricted)
 
-        if isinstance(self.relations, set):
-            for (start_node, end_node) in self.relations.copy():
-                if start_node == node_name or end_node == node_name:
-                    self.relations.remove((start_node, end_node))
+    def fingerprint(self):
+        """Returns a hash of the worlds and relations that does not depend on
+        their order. It is computed once and then kept up to date as worlds
+        are removed, so worlds and relations must not be changed otherwise.
+        Like other hashes of strings it differs between Python processes.
+        """
+        if self._fingerprint is None:
+            fingerprint = 0
+            for world in self.worlds:
+                fingerprint += hash(world)
+            for key, value in self._relations_by_agent().items():
+                for (start_node, end_node) in value:
+                    fingerprint += hash((key, start_node, end_node))
+            self._fingerprint = fingerprint % FINGERPRINT_MODULUS
+        return self._fingerprint
 
+    def _relations_by_agent(self):
+        """Returns the relations as a dict from agent to relation, with the
+        agent None for a plain relation set.
+        """
         if isinstance(self.relations, dict):
-            for key, value in self.relations.items():
-                for (start_node, end_node) in value.copy():
-                    if start_node == node_name or end_node == node_name:
-                        value.remove((start_node, end_node))
+            return self.relations
+        return {None: self.relations}
 
     def short_solve(self, formula):
+        failing = self._failing_if_propositional(formula)
+        if failing is not None:
+            return self.restrict_to(self._world_names() - failing)
+
         sub_set = [{}]
         worlds_by_name = []
         #count = 0
         for w in self.worlds:
             worlds_by_name.append(w.name)
+        names = set(worlds_by_name)
         for z in chain.from_iterable(
                 combinations(worlds_by_name, r + 1)
                 for r in range(len(worlds_by_name) + 1)):
             #count+=1
             #if count % 100 == 0:
             #    print(count)
-            ks = KripkeStructure(self.worlds.copy(), copy.deepcopy(self.relations))
-            for element in set(z):
-                ks.remove_node_by_name(element)
+            ks = self.restrict_to(names - set(z))
             if ks.nodes_not_follow_formula(formula) == []:
                 return ks
 
@@ -84,41 +233,313 @@ class KripkeStructure:
             sub_set.append(set(z))
         return sub_set
 
-    def nodes_not_follow_formula(self, formula):
+    def nodes_not_follow_formula(self, formula, processes=None):
         """Returns a list with all worlds of Kripke structure, where formula
-         is not satisfiable
+         is not satisfiable. Models of at least PARALLEL_THRESHOLD worlds are
+         split into chunks that are checked in a pool of processes, unless
+         processes says otherwise. Processes are only forked from the main
+         thread, as forking while other threads hold locks is not safe.
         """
+        if processes is None:
+            processes = (os.cpu_count() or 1) if len(self.worlds) >= PARALLEL_THRESHOLD else 1
+        if processes > 1 and "fork" in multiprocessing.get_all_start_methods() \
+                and threading.current_thread() is threading.main_thread():
+            return self._nodes_not_follow_formula_parallel(formula, processes)
+
         nodes_not_follow_formula = []
+        evaluate = self.compile(formula)
         for nodes in self.worlds:
-            if not formula.semantic(self, nodes.name):
+            if not evaluate(nodes.name):
                 nodes_not_follow_formula.append(nodes.name)
         return nodes_not_follow_formula
 
+    def bisimulation_contraction(self, groups=()):
+        """Returns a Kripke structure in which all bisimilar worlds are
+        collapsed into one, together with a dict mapping every world name to
+        the world that represents it. The truth of every formula without
+        distributed knowledge is preserved in the representing worlds.
+        Distributed knowledge is not invariant under bisimulation, so for
+        each of the given groups worlds are only merged as far as the truth
+        of Box_D formulas of that group is preserved as well.
+        """
+        return self._contract(set(), groups)
+
+    def _contract(self, retired, groups):
+        """Merges the worlds that agree on all atoms except the retired ones
+        and are bisimilar over the relations of all agents and the
+        distributed knowledge relations of groups. Returns the merged
+        structure without the retired atoms and the representatives.
+        """
+        relations = self._relations_by_agent()
+        successors = {agent: self.successors(agent) for agent in relations}
+        groups = [frozenset(group) for group in groups if len(group) > 1]
+        for group in groups:
+            successors[group] = self.distributed_successors(group)
+
+        # Worlds of blocks whose merge would add distributed knowledge edges
+        # are kept apart, until the quotient relations of every group agree
+        separated = set()
+        while True:
+            blocks = self._refine_blocks(successors, retired, separated)
+            representatives = {}
+            block_representative = {}
+            for world in self.worlds:
+                representative = block_representative.setdefault(blocks[world.name], world.name)
+                representatives[world.name] = representative
+
+            contracted = {}
+            for agent, relation in relations.items():
+                contracted[agent] = {(representatives[start_node], representatives[end_node])
+                                     for (start_node, end_node) in relation
+                                     if start_node in representatives and end_node in representatives}
+
+            added = set()
+            for group in groups:
+                group_relations = sorted((contracted.get(agent, set()) for agent in group), key=len)
+                intersection = set(group_relations[0]).intersection(*group_relations[1:])
+                intersection -= {(representatives[start_node], representatives[end_node])
+                                 for start_node, end_nodes in successors[group].items()
+                                 for end_node in end_nodes}
+                for pair in intersection:
+                    added.update(pair)
+            if not added:
+                break
+            separated.update(name for name, representative in representatives.items()
+                             if representative in added)
+
+        worlds = []
+        for world in self.worlds:
+            if representatives[world.name] == world.name:
+                worlds.append(World(world.name, {fact: value for fact, value in world.assignment.items()
+                                                 if fact not in retired}))
+        if not isinstance(self.relations, dict):
+            contracted = contracted[None]
+        return KripkeStructure(worlds, contracted), representatives
+
+    def _refine_blocks(self, successors, retired, separated):
+        """Partition refinement, starting from worlds with equal valuations
+        over the atoms that are not retired. Separated worlds start in a
+        block of their own. Returns a dict from world name to block number.
+        """
+        initial_blocks = {}
+        blocks = {}
+        for world in self.worlds:
+            valuation = frozenset(fact for fact, value in world.assignment.items()
+                                  if value and fact not in retired)
+            key = (valuation, world.name if world.name in separated else None)
+            blocks[world.name] = initial_blocks.setdefault(key, len(initial_blocks))
+        nr_of_blocks = len(initial_blocks)
+        while True:
+            signatures = {}
+            refined = {}
+            for world in self.worlds:
+                signature = (blocks[world.name],) + tuple(
+                    frozenset(blocks[end_node] for end_node in successors[key].get(world.name, ())
+                              if end_node in blocks)
+                    for key in successors)
+                refined[world.name] = signatures.setdefault(signature, len(signatures))
+            blocks = refined
+            if len(signatures) == nr_of_blocks:
+                return blocks
+            nr_of_blocks = len(signatures)
+
+    def project(self, atoms, groups=()):
+        """Returns a Kripke structure in which atoms are retired, together
+        with a dict mapping every world name to the world that represents it.
+        Worlds that are bisimilar over the remaining atoms are merged, see
+        bisimulation_contraction, and the retired atoms are dropped from the
+        valuations. Worlds can only merge if their valuations agree on the
+        remaining atoms; when no worlds merge this structure itself is
+        returned unchanged, retired atoms included.
+        """
+        retired = set(atoms)
+        valuations = set()
+        for world in self.worlds:
+            valuation = frozenset(fact for fact, value in world.assignment.items()
+                                  if value and fact not in retired)
+            if valuation in valuations:
+                break
+            valuations.add(valuation)
+        else:
+            return self, {world.name: world.name for world in self.worlds}
+
+        projected, representatives = self._contract(retired, groups)
+        if len(projected.worlds) == len(self.worlds):
+            return self, representatives
+        return projected, representatives
+
+    def _nodes_not_follow_formula_parallel(self, formula, processes):
+        """Checks chunks of worlds in forked processes that share this model
+        read-only, and merges the failing worlds in model order. The formula
+        is compiled before the processes are forked and handed to the workers
+        of this pool only, so the successor lists are inherited by every
+        worker and concurrent checks do not share an evaluator.
+        """
+        names = [world.name for world in self.worlds]
+        chunk_size = max(1, -(-len(names) // (processes * 4)))
+        chunks = [names[i:i + chunk_size] for i in range(0, len(names), chunk_size)]
+
+        evaluator = self.compile(formula)
+        with multiprocessing.get_context("fork").Pool(
+                processes, initializer=_set_shared_evaluator, initargs=(evaluator,)) as pool:
+            results = pool.map(_nodes_not_follow_formula_in_chunk, chunks)
+        return list(chain.from_iterable(results))
+
+    def distributed_successors(self, agents):
+        """Returns a dict mapping each world name to the worlds it can reach
+        through the intersection of the relations of agents, the relation of
+        their distributed knowledge. The result is cached per group until the
+        model changes.
+        """
+        cache = self._successor_cache()
+        group = frozenset(agents)
+        if group not in cache:
+            relations = [self.relations.get(agent, set()) for agent in group]
+            if relations and all(isinstance(relation, EquivalenceRelation) for relation in relations):
+                cache[group] = EquivalenceRelation.intersection_of(relations).successors()
+                return cache[group]
+            if group:
+                relations = sorted(relations, key=len)
+                relation = set(relations[0]).intersection(*relations[1:])
+            else:
+                relation = {(start.name, end.name) for start in self.worlds for end in self.worlds}
+            successors = {}
+            for (start_node, end_node) in relation:
+                successors.setdefault(start_node, []).append(end_node)
+            cache[group] = successors
+        return cache[group]
+
+    def successors(self, agent):
+        """Returns a dict mapping each world name to the worlds it can reach
+        through the relation of agent, or through the plain relation set when
+        agent is None. The result is cached per agent until the model changes.
+        """
+        cache = self._successor_cache()
+        key = ("agent", agent)
+        if key not in cache:
+            relation = self._relations_by_agent().get(agent, set())
+            if isinstance(relation, EquivalenceRelation):
+                cache[key] = relation.successors()
+                return cache[key]
+            successors = {}
+            for (start_node, end_node) in relation:
+                successors.setdefault(start_node, []).append(end_node)
+            cache[key] = successors
+        return cache[key]
+
+    def _successor_cache(self):
+        """Returns the cached successor lists, emptied whenever worlds have
+        been removed since they were built.
+        """
+        if self._successors_version != self.version:
+            self._successors = {}
+            self._successors_version = self.version
+        return self._successors
+
+    def product_update(self, event_model, root=None):
+        """Returns the Kripke structure after the events of event_model,
+        whose worlds are the pairs of a world and an event whose
+        precondition holds in it, named by product_world_name. An agent
+        relates two pairs iff it relates both their worlds and their events.
+        Given a root (world name, event name) only the pairs reachable from
+        it are built, by a breadth first search from the root.
+        Successor pairs depend only on the successors of a world, so they are
+        computed once per equivalence class of worlds and event.
+        """
+        preconditions = {event.name: self.compile(event.precondition)
+                         for event in event_model.events}
+        relations = self._relations_by_agent()
+        event_relations = event_model._relations_by_agent()
+
+        successor_classes = {}
+        event_successors = {}
+        for agent in relations:
+            successors = self.successors(agent)
+            # Worlds with the same successors share one class
+            classes = {}
+            successor_classes[agent] = {
+                name: classes.setdefault(frozenset(ends), (len(classes), ends))
+                for name, ends in successors.items()}
+            event_successors[agent] = {}
+            for (start_node, end_node) in event_relations.get(agent, ()):
+                event_successors[agent].setdefault(start_node, []).append(end_node)
+
+        worlds_by_name = {world.name: world for world in self.worlds}
+        if root is None:
+            pairs = [(world.name, event.name) for world in self.worlds
+                     for event in event_model.events
+                     if preconditions[event.name](world.name)]
+        else:
+            if root[0] not in worlds_by_name or not preconditions[root[1]](root[0]):
+                raise ValueError("The root event can not happen in the root world.")
+            pairs = [root]
+        reached = set(pairs)
+        queue = deque(pairs)
+        order = list(pairs)
+
+        product_successors = {agent: {} for agent in relations}
+        class_successors = {}
+        while queue:
+            world_name, event_name = queue.popleft()
+            for agent in relations:
+                world_class = successor_classes[agent].get(world_name)
+                if world_class is None:
+                    continue
+                key = (agent, world_class[0], event_name)
+                if key not in class_successors:
+                    class_successors[key] = [
+                        (end_world, end_event)
+                        for end_event in event_successors[agent].get(event_name, ())
+                        for end_world in world_class[1]
+                        if preconditions[end_event](end_world)]
+                product_successors[agent][(world_name, event_name)] = class_successors[key]
+                if root is not None:
+                    for pair in class_successors[key]:
+                        if pair not in reached:
+                            reached.add(pair)
+                            queue.append(pair)
+                            order.append(pair)
+
+        worlds = [World(product_world_name(world_name, event_name),
+                        dict(worlds_by_name[world_name].assignment))
+                  for (world_name, event_name) in order]
+        product = {}
+        for agent, successors in product_successors.items():
+            product[agent] = {(product_world_name(*start), product_world_name(*end))
+                              for start, ends in successors.items()
+                              for end in ends}
+        if not isinstance(self.relations, dict):
+            product = product[None]
+        return KripkeStructure(worlds, product)
+
+    def compile(self, formula):
+        """Returns a flat evaluator of formula specialised to this Kripke
+        structure. The structure must not change while the evaluator is used.
+        """
+        return FormulaCompiler(self).compile(formula)
+
     def __eq__(self, other):
-        """Returns true iff two Kripke structures are equivalent
+        """Returns true iff two Kripke structures are equivalent, regardless
+        of the order of their worlds. Structures with different fingerprints
+        are rejected without comparing them.
         """
-        if (self.worlds == [] and not other.worlds == []) \
-                or (not self.worlds == [] and other.worlds == []):
+        if not isinstance(other, KripkeStructure):
+            return NotImplemented
+        if self.fingerprint() != other.fingerprint():
+            return False
+        if set(self.worlds) != set(other.worlds):
             return False
-        for (i, j) in zip(self.worlds, other.worlds):
-            if not i.__eq__(j):
-                return False
-
-        if isinstance(self.relations, set):
-            for (i, j) in zip(self.relations, other.relations):
-                if not i == j:
-                    return False
 
-        if isinstance(self.relations, dict):
-            for key, value in self.relations.items():
-                try:
-                    if not value == other.relations[key]:
-                        return False
-                except KeyError:
-                    if not value == set():
-                        return False
+        relations = self._relations_by_agent()
+        other_relations = other._relations_by_agent()
+        for key in set(relations) | set(other_relations):
+            if set(relations.get(key, ())) != set(other_relations.get(key, ())):
+                return False
         return True
 
+    def __hash__(self):
+        return self.fingerprint()
+
     def __str__(self):
         worlds_str = "(W = {"
         for world in self.worlds:
@@ -126,6 +547,273 @@ class KripkeStructure:
         return worlds_str + '}, R = ' + str(self.relations) + ')'
 
 
+class EquivalenceRelation(Set):
+    """
+    A relation that relates every two worlds of the same class, each world to
+    itself included, like the starting relations of an agent who only knows
+    their own hand. It is kept as its classes of world names, so it takes
+    space for the worlds rather than for the pairs, and behaves as the set of
+    its pairs, which are only generated when it is iterated.
+    """
+
+    def __init__(self, classes):
+        self.classes = [list(names) for names in classes if names]
+        self._class_of = {name: names for names in self.classes for name in names}
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        # Set operations on the pairs return plain sets of pairs
+        return set(iterable)
+
+    @classmethod
+    def intersection_of(cls, relations):
+        """Returns the intersection of equivalence relations, which relates
+        the worlds that are in the same class of every relation.
+        """
+        classes = {}
+        for name in relations[0]._class_of:
+            if all(name in relation._class_of for relation in relations):
+                key = tuple(id(relation._class_of[name]) for relation in relations)
+                classes.setdefault(key, []).append(name)
+        return cls(classes.values())
+
+    def __contains__(self, pair):
+        start_node, end_node = pair
+        names = self._class_of.get(start_node)
+        return names is not None and self._class_of.get(end_node) is names
+
+    def __iter__(self):
+        for names in self.classes:
+            for start_node in names:
+                for end_node in names:
+                    yield (start_node, end_node)
+
+    def __len__(self):
+        return sum(len(names) ** 2 for names in self.classes)
+
+    def __repr__(self):
+        return "EquivalenceRelation(" + repr(self.classes) + ")"
+
+    def successors(self):
+        """Returns a dict mapping each world name to the worlds it can reach,
+        the worlds of its class. Worlds of a class share one list, which must
+        not be changed.
+        """
+        return dict(self._class_of)
+
+    def pairs_of(self, node_names):
+        """Returns the pairs that start or end in one of the named worlds.
+        """
+        affected = {id(self._class_of[name]): self._class_of[name]
+                    for name in node_names if name in self._class_of}
+        pairs = []
+        for names in affected.values():
+            for start_node in names:
+                for end_node in names:
+                    if start_node in node_names or end_node in node_names:
+                        pairs.append((start_node, end_node))
+        return pairs
+
+    def remove_worlds(self, node_names):
+        """Removes the named worlds and every pair with one of them.
+        """
+        affected = {}
+        for name in node_names:
+            if name in self._class_of:
+                names = self._class_of.pop(name)
+                affected[id(names)] = names
+        for names in affected.values():
+            names[:] = [name for name in names if name not in node_names]
+        if any(not names for names in affected.values()):
+            self.classes = [names for names in self.classes if names]
+
+    def restrict_to(self, node_names):
+        """Returns the relation between the named worlds only.
+        """
+        return EquivalenceRelation([name for name in names if name in node_names]
+                                   for names in self.classes)
+
+
+class Event:
+    """
+    An event of an event model, which can only happen in worlds in which its
+    precondition holds.
+    """
+
+    def __init__(self, name, precondition):
+        self.name = name
+        self.precondition = precondition
+
+
+class EventModel:
+    """
+    Describes what agents observe of an action: its possible events and, like
+    the relations of a Kripke structure, which events each agent can not tell
+    apart.
+    """
+
+    def __init__(self, events, relations):
+        self.events = events
+        self.relations = relations
+
+    def _relations_by_agent(self):
+        if isinstance(self.relations, dict):
+            return self.relations
+        return {None: self.relations}
+
+
+class CompiledFormula:
+    """
+    Flat evaluator of a modal logic formula produced by FormulaCompiler.
+    Calling it with a world name returns the truth of the formula in that
+    world. Constant formulas carry their value and skip evaluation.
+    """
+
+    def __init__(self, key, evaluate=None, constant=None):
+        self.key = key
+        self.evaluate = evaluate
+        self.constant = constant
+
+    def __call__(self, world_name):
+        if self.constant is not None:
+            return self.constant
+        return self.evaluate(world_name)
+
+
+class FormulaCompiler:
+    """
+    Turns a formula AST into closures specialised to the worlds and relations
+    of one Kripke structure. Valuations and successor lists are resolved once,
+    structurally equal subformulas are compiled to the same memoised closure
+    and constant subformulas are folded.
+    """
+
+    TRUE = CompiledFormula(("const", True), constant=True)
+    FALSE = CompiledFormula(("const", False), constant=False)
+
+    def __init__(self, ks):
+        self.ks = ks
+        self._nodes = {}
+        self._valuation = None
+
+    def compile(self, formula):
+        """Compiles formula, falling back to its semantic method for
+        operators that do not know how to compile themselves.
+        """
+        if hasattr(formula, "compile"):
+            return formula.compile(self)
+        return self.opaque(formula)
+
+    def clear(self):
+        """Forgets the compiled subformulas and their memoised truth values.
+        Valuations and successor lists of the structure are kept.
+        """
+        self._nodes = {}
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def constant(self, value):
+        return self.TRUE if value else self.FALSE
+
+    def atom(self, name):
+        if self._valuation is None:
+            self._valuation = {}
+            for world in self.ks.worlds:
+                for fact, value in world.assignment.items():
+                    if value:
+                        self._valuation.setdefault(fact, set()).add(world.name)
+        truth = self._valuation.get(name)
+        if not truth:
+            return self.FALSE
+        if len(truth) == len(self.ks.worlds):
+            return self.TRUE
+        return self._node(("atom", name), truth.__contains__, memoise=False)
+
+    def negation(self, inner):
+        if inner.constant is not None:
+            return self.constant(not inner.constant)
+        if inner.key[0] == "not":
+            return self._nodes[inner.key[1]]
+        evaluate = inner.evaluate
+        return self._node(("not", inner.key), lambda world: not evaluate(world), memoise=False)
+
+    def conjunction(self, left, right):
+        if left.constant is False or right.constant is False:
+            return self.FALSE
+        if left.constant is True or left.key == right.key:
+            return right
+        if right.constant is True:
+            return left
+        left_evaluate, right_evaluate = left.evaluate, right.evaluate
+        return self._node(("and", left.key, right.key),
+                          lambda world: left_evaluate(world) and right_evaluate(world))
+
+    def disjunction(self, left, right):
+        if left.constant is True or right.constant is True:
+            return self.TRUE
+        if left.constant is False or left.key == right.key:
+            return right
+        if right.constant is False:
+            return left
+        left_evaluate, right_evaluate = left.evaluate, right.evaluate
+        return self._node(("or", left.key, right.key),
+                          lambda world: left_evaluate(world) or right_evaluate(world))
+
+    def box(self, agent, inner):
+        """Box over the relation of agent, or over the plain relation set
+        when agent is None.
+        """
+        if inner.constant is True:
+            return self.TRUE
+        successors = self.successors(agent)
+        return self._node(("box", agent, inner.key),
+                          lambda world: all(inner(other) for other in successors.get(world, ())))
+
+    def distributed_box(self, agents, inner):
+        """Box over the distributed knowledge relation of a group of agents.
+        """
+        if inner.constant is True:
+            return self.TRUE
+        successors = self.ks.distributed_successors(agents)
+        return self._node(("distributed_box", frozenset(agents), inner.key),
+                          lambda world: all(inner(other) for other in successors.get(world, ())))
+
+    def diamond(self, agent, inner):
+        if inner.constant is False:
+            return self.FALSE
+        successors = self.successors(agent)
+        return self._node(("diamond", agent, inner.key),
+                          lambda world: any(inner(other) for other in successors.get(world, ())))
+
+    def opaque(self, formula):
+        ks = self.ks
+        return self._node(("opaque", id(formula)), lambda world: formula.semantic(ks, world))
+
+    def successors(self, agent):
+        """Returns a dict mapping each world name to the worlds it can reach
+        through the relation of agent, see KripkeStructure.successors.
+        """
+        return self.ks.successors(agent)
+
+    def _node(self, key, evaluate, memoise=True):
+        if key in self._nodes:
+            return self._nodes[key]
+        if memoise:
+            cache = {}
+            compute = evaluate
+
+            def evaluate(world):
+                try:
+                    return cache[world]
+                except KeyError:
+                    result = cache[world] = compute(world)
+                    return result
+        node = CompiledFormula(key, evaluate)
+        self._nodes[key] = node
+        return node
+
+
 class World:
     """
     Represents the nodes of Kripke and it extends the graph to Kripke
@@ -139,5 +827,8 @@ class World:
     def __eq__(self, other):
         return self.name == other.name and self.assignment == other.assignment
 
+    def __hash__(self):
+        return hash((self.name, frozenset(self.assignment.items())))
+
     def __str__(self):
         return "(" + self.name + ',' + str(self.assignment) + ')'